@@ -1,9 +1,11 @@
 from time import time
 from flask import Blueprint, request, jsonify, make_response
-from werkzeug.security import generate_password_hash, check_password_hash
 from models import User, db
-from helpers import make_token, current_user, set_auth_cookie, clear_auth_cookie, err
-from store import comments_store
+from helpers import (
+    make_token, current_user, current_user_id, current_user_row, forget_user, forget_token,
+    request_token, set_auth_cookie, clear_auth_cookie, err, Page,
+)
+from store_backend import data_store
 
 auth_bp = Blueprint("auth", __name__)
 
@@ -20,6 +22,7 @@ def auth_register():
         return err("密碼至少需要 6 個字元")
     if User.query.filter_by(email=email).first():
         return err("此 Email 已被使用", 409)
+    from werkzeug.security import generate_password_hash
     u = User(email=email, password_hash=generate_password_hash(password),
              display_name=display_name)
     db.session.add(u)
@@ -35,6 +38,7 @@ def auth_login():
     body     = request.get_json(silent=True) or {}
     email    = (body.get("email") or "").strip().lower()
     password = (body.get("password") or "")
+    from werkzeug.security import check_password_hash
     u = User.query.filter_by(email=email).first()
     if not u or not check_password_hash(u.password_hash, password):
         return err("帳號或密碼錯誤", 401)
@@ -46,6 +50,7 @@ def auth_login():
 
 @auth_bp.route("/api/auth/logout", methods=["POST"])
 def auth_logout():
+    forget_token(request_token())
     resp = make_response(jsonify({"ok": True}))
     clear_auth_cookie(resp)
     return resp
@@ -61,7 +66,7 @@ def auth_me():
 
 @auth_bp.route("/api/auth/profile", methods=["PUT"])
 def auth_profile():
-    u = current_user()
+    u = current_user_row()
     if not u:
         return err("未授權", 401)
     body         = request.get_json(silent=True) or {}
@@ -70,6 +75,7 @@ def auth_profile():
         if len(display_name) > 30:
             return err("名稱最長 30 個字")
         u.display_name = display_name
+    from werkzeug.security import generate_password_hash, check_password_hash
     current_pw = body.get("current_password", "")
     new_pw     = body.get("new_password", "")
     if current_pw or new_pw:
@@ -79,28 +85,31 @@ def auth_profile():
             return err("新密碼至少需要 6 個字元")
         u.password_hash = generate_password_hash(new_pw)
     db.session.commit()
+    forget_user(u.id)
     return jsonify({"user": u.to_dict()})
 
 
 @auth_bp.route("/api/auth/my-comments")
 def auth_my_comments():
-    u = current_user()
-    if not u:
+    uid = current_user_id()
+    if uid is None:
         return err("未授權", 401)
     results = []
-    for key, lst in comments_store.items():
+    for key, c in data_store.user_comments(uid):
         parts = key.split("|||", 1)
         if len(parts) != 2:
             continue
         code, food_name = parts
-        for c in lst:
-            if c.get("user_id") == u.id:
-                results.append({
-                    "id":           c["id"],
-                    "country_code": code,
-                    "food_name":    food_name,
-                    "text":         c["text"],
-                    "ts":           c["ts"],
-                })
-    results.sort(key=lambda x: x["ts"], reverse=True)
-    return jsonify({"comments": results})
+        results.append({
+            "id":           c["id"],
+            "country_code": code,
+            "food_name":    food_name,
+            "text":         c["text"],
+            "ts":           c["ts"],
+        })
+    try:
+        page = Page.from_request()
+    except ValueError:
+        return err("cursor 無效")
+    results, meta = page.apply(results, lambda x: (-x["ts"], -x["id"]))
+    return jsonify({"comments": results, **meta})
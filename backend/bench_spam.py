@@ -0,0 +1,66 @@
+"""Per-comment cost of the spam pipeline as the blocklist grows.
+
+    python bench_spam.py
+
+The legacy row is the regex + list filter that is_spam() used to run, for
+reference. Every pipeline row runs all rules, including the flood index
+holding 10k recent comments, except the "no flood" row; times are the best
+of 5 runs.
+"""
+from __future__ import annotations
+import random, re
+from time import perf_counter
+import spam
+
+_CJK = "好吃拉麵壽司湯頭濃郁推薦便宜服務熱情下次再來味道鹹甜"
+
+
+def _legacy(text: str) -> bool:
+    if re.search(r"(.)\1{6,}", text):
+        return True
+    ascii_alpha = [c for c in text if c.isascii() and c.isalpha()]
+    return len(ascii_alpha) > 8 and sum(c.isupper() for c in ascii_alpha) / len(ascii_alpha) > 0.7
+
+
+def _comments(n: int, rng: random.Random) -> list[str]:
+    out = []
+    for _ in range(n):
+        parts = [rng.choice(_CJK) for _ in range(rng.randint(20, 120))]
+        parts += [" great ramen "] * rng.randint(0, 3)
+        rng.shuffle(parts)
+        out.append("".join(parts)[:300])
+    return out
+
+
+def _words(n: int, rng: random.Random) -> list[str]:
+    return ["".join(rng.choice(_CJK + "abcdefghijklmnop") for _ in range(rng.randint(3, 8)))
+            for _ in range(n)]
+
+
+def _per_comment_us(fn, texts: list[str]) -> float:
+    best = float("inf")
+    for _ in range(5):
+        t = perf_counter()
+        for text in texts:
+            fn(text)
+        best = min(best, perf_counter() - t)
+    return best / len(texts) * 1e6
+
+
+def main():
+    rng   = random.Random(1)
+    texts = _comments(2000, rng)
+    p     = spam.Pipeline([spam.RepeatRule(), spam.ShoutRule(), spam.LinkRule()])
+    flood = spam.FloodIndex()
+    for text in _comments(10000, rng):
+        flood.add(p.scan(text).norm)  # as spam.record() does
+    print(f"{'legacy is_spam':<24} {_per_comment_us(_legacy, texts):7.1f} µs")
+    print(f"{'pipeline, no flood':<24} {_per_comment_us(p.is_spam, texts):7.1f} µs")
+    for n in (0, 100, 1000, 10000):
+        p = spam.Pipeline([spam.RepeatRule(), spam.ShoutRule(), spam.LinkRule(),
+                           spam.BlocklistRule(_words(n, rng)), spam.FloodRule(flood)])
+        print(f"{f'pipeline, {n} words':<24} {_per_comment_us(p.is_spam, texts):7.1f} µs")
+
+
+if __name__ == "__main__":
+    main()
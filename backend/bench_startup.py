@@ -0,0 +1,53 @@
+"""Cold-start benchmark: module import, app construction and first requests.
+
+    python bench_startup.py [runs]
+
+Each run is a fresh interpreter, so nothing is cached between runs. Prints
+the median of each phase in milliseconds.
+"""
+from __future__ import annotations
+import json, os, statistics, subprocess, sys
+from pathlib import Path
+
+_PROBE = r"""
+import json, sys
+from time import perf_counter
+t0 = perf_counter()
+import app as app_module
+t1 = perf_counter()
+app = app_module.create_app() if hasattr(app_module, "create_app") else app_module.app
+t2 = perf_counter()
+client = app.test_client()
+client.get("/api/ping")
+t3 = perf_counter()
+client.get("/api/food/JP/%E5%A3%BD%E5%8F%B8/likes")
+t4 = perf_counter()
+client.get("/api/search?q=%E9%BA%B5")
+t5 = perf_counter()
+print(json.dumps({
+    "import":          (t1 - t0) * 1000,
+    "create_app":      (t2 - t1) * 1000,
+    "first /ping":     (t3 - t2) * 1000,
+    "first /likes":    (t4 - t3) * 1000,
+    "first /search":   (t5 - t4) * 1000,
+    "total":           (t5 - t0) * 1000,
+}))
+"""
+
+
+def main(runs: int = 5):
+    here = Path(__file__).resolve().parent
+    env  = dict(os.environ)
+    env.setdefault("DATABASE_URL", "sqlite://")  # none of the probed routes touch it
+    samples: dict[str, list[float]] = {}
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", _PROBE], cwd=here, env=env,
+                             capture_output=True, text=True, check=True).stdout
+        for phase, ms in json.loads(out.strip().splitlines()[-1]).items():
+            samples.setdefault(phase, []).append(ms)
+    for phase, vals in samples.items():
+        print(f"{phase:<15} {statistics.median(vals):8.1f} ms")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
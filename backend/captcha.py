@@ -0,0 +1,113 @@
+from __future__ import annotations
+import hashlib, hmac, random, secrets, threading
+from collections import OrderedDict
+from time import time
+from config import CAPTCHA_MODE, CAPTCHA_TTL, CAPTCHA_MAX_ENTRIES, JWT_SECRET
+
+COOKIE = "captcha"
+
+ERR_MISSING = "請先取得驗證碼"
+ERR_EXPIRED = "驗證碼已過期，請重新取得"
+ERR_WRONG   = "驗證碼錯誤"
+
+
+def _question() -> tuple[str, int]:
+    a, b = random.randint(1, 9), random.randint(1, 9)
+    return f"{a} + {b} = ?", a + b
+
+
+class MemoryCaptcha:
+    """Expected answer per IP, evicted after CAPTCHA_TTL or beyond max_entries.
+
+    Every entry lives for the same TTL and a re-issue moves it to the end, so
+    the OrderedDict is also sorted by expiry: eviction only looks at the front.
+    """
+
+    def __init__(self, max_entries: int = CAPTCHA_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.entries: OrderedDict[str, tuple[int, float]] = OrderedDict()
+        self.lock = threading.Lock()
+
+    def issue(self, ip: str) -> tuple[dict, str | None]:
+        question, answer = _question()
+        now = time()
+        with self.lock:
+            self.entries[ip] = (answer, now + CAPTCHA_TTL)
+            self.entries.move_to_end(ip)
+            while self.entries:
+                _, expires = next(iter(self.entries.values()))
+                if expires > now and len(self.entries) <= self.max_entries:
+                    break
+                self.entries.popitem(last=False)
+        return {"question": question, "expires_in": CAPTCHA_TTL}, None
+
+    def verify(self, ip: str, given: int, token: str = "") -> str | None:
+        with self.lock:
+            entry = self.entries.get(ip)
+            if not entry:
+                return ERR_MISSING
+            expected, expires = entry
+            if time() > expires:
+                self.entries.pop(ip, None)
+                return ERR_EXPIRED
+            if given != expected:
+                return ERR_WRONG
+            self.entries.pop(ip, None)
+            return None
+
+
+class SignedCaptcha:
+    """Stateless challenges: "<expires>.<nonce>.<mac>", where the MAC covers
+    the IP, expiry, nonce and answer. The answer itself is not in the token;
+    verifying recomputes the MAC with the answer given.
+
+    Solved nonces are remembered until they expire, per process, so a token
+    cannot be replayed on the same worker; across workers replay within the
+    TTL is bounded by the comment rate limit.
+    """
+
+    def __init__(self, secret: str = JWT_SECRET, max_spent: int = CAPTCHA_MAX_ENTRIES):
+        self.key       = hashlib.sha256(b"captcha:" + secret.encode("utf-8")).digest()
+        self.max_spent = max_spent
+        self.spent: OrderedDict[str, float] = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _mac(self, ip: str, expires: int, nonce: str, answer: int) -> str:
+        msg = f"{ip}|{expires}|{nonce}|{answer}".encode("utf-8")
+        return hmac.new(self.key, msg, hashlib.sha256).hexdigest()[:32]
+
+    def issue(self, ip: str) -> tuple[dict, str | None]:
+        question, answer = _question()
+        expires = int(time()) + CAPTCHA_TTL
+        nonce   = secrets.token_hex(8)
+        token   = f"{expires}.{nonce}.{self._mac(ip, expires, nonce, answer)}"
+        return {"question": question, "expires_in": CAPTCHA_TTL, "token": token}, token
+
+    def verify(self, ip: str, given: int, token: str = "") -> str | None:
+        try:
+            expires_s, nonce, mac = token.split(".")
+            expires = int(expires_s)
+        except ValueError:
+            return ERR_MISSING
+        now = time()
+        if now > expires:
+            return ERR_EXPIRED
+        if not hmac.compare_digest(mac, self._mac(ip, expires, nonce, given)):
+            return ERR_WRONG
+        with self.lock:
+            if nonce in self.spent:
+                return ERR_MISSING
+            self.spent[nonce] = expires
+            while self.spent and (next(iter(self.spent.values())) < now
+                                  or len(self.spent) > self.max_spent):
+                self.spent.popitem(last=False)
+        return None
+
+
+def _make_captcha():
+    if CAPTCHA_MODE == "signed":
+        return SignedCaptcha()
+    return MemoryCaptcha()
+
+
+captcha = _make_captcha()
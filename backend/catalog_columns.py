@@ -0,0 +1,171 @@
+from __future__ import annotations
+import threading
+from bisect import bisect_right
+try:
+    import numpy as np
+except ImportError:  # optional: without NumPy the routes keep their per-food loops
+    np = None
+from config import COLUMNS_MIN_FOODS
+from store_backend import CounterView, data_store
+from search_index import SearchIndex, get_index
+from helpers import Page, encode_cursor
+
+# Sort orders as column parts, matching the Python sort keys of the routes
+# ("-x" = descending). "cn" is the rank of (code, name), "nc" of (name, code).
+SEARCH_SORTS = {
+    "likes":  ("-likes", "-avg10", "cn"),
+    "rating": ("-avg10", "-likes", "cn"),
+    "name":   ("nc",),
+}
+FOOD_SORTS = {
+    "likes":  ("-likes", "cn"),
+    "rating": ("-avg10", "-likes", "cn"),
+    "name":   ("cn",),
+}
+
+
+class Columns(CounterView):
+    """The catalog as NumPy columns, one row per search-index doc.
+
+    likes, rating_sum, rating_count and avg10 (the average x10, rounded as
+    rating_stats rounds it) are patched in place by touch(); country ids,
+    the tag matrix and the interned name ranks change only with the catalog.
+    """
+
+    def __init__(self, index: SearchIndex):
+        super().__init__(index)
+        docs = index.docs
+        n    = len(docs)
+        self.country_ids = {code: c for c, code in enumerate(index.countries)}
+        self.country = np.fromiter((self.country_ids[d.code] for d in docs), np.int16, n)
+        self.tags    = np.zeros((n, len(index.tag_ids)), dtype=bool)
+        for t, tid in index.tag_ids.items():
+            self.tags[index.tags[t], tid] = True
+        # Names interned as their rank in (code, name) and (name, code) order;
+        # the doc index breaks ties so duplicates keep catalog order.
+        self.cn_keys = sorted((d.code, d.food.get("name", ""), i) for i, d in enumerate(docs))
+        self.nc_keys = sorted((d.food.get("name", ""), d.code, i) for i, d in enumerate(docs))
+        self.cn = np.empty(n, np.int64)
+        self.nc = np.empty(n, np.int64)
+        self.cn[[k[2] for k in self.cn_keys]] = np.arange(n)
+        self.nc[[k[2] for k in self.nc_keys]] = np.arange(n)
+        self.likes        = np.zeros(n, np.int64)
+        self.rating_sum   = np.zeros(n, np.int64)
+        self.rating_count = np.zeros(n, np.int64)
+        self.avg10        = np.zeros(n, np.int64)
+        for i, d in enumerate(docs):
+            self._rescore(i, d.key)
+
+    def _rescore(self, i: int, key: str):
+        a = data_store.food_agg(key)
+        self.likes[i], self.rating_sum[i], self.rating_count[i] = a.likes, a.rating_sum, a.rating_count
+        self.avg10[i] = round(round(a.rating_sum / a.rating_count, 1) * 10) if a.rating_count else 0
+
+    # ── Queries ──
+    def select(self, ids=None, country: str = "", tag: str = "", min_rating: float = 0.0):
+        """Row ids (ascending) among `ids` (default all) passing the filters."""
+        mask = np.ones(len(self.likes), dtype=bool)
+        if country:
+            if country not in self.country_ids:
+                return np.empty(0, np.int64)
+            mask &= self.country == self.country_ids[country]
+        if tag:
+            tid = self.index.tag_ids.get(tag)
+            if tid is None:
+                return np.empty(0, np.int64)
+            mask &= self.tags[:, tid]
+        if min_rating > 0:
+            mask &= self.avg10 / 10 >= min_rating
+        if ids is not None:
+            keep = np.zeros_like(mask)
+            keep[np.asarray(ids, dtype=np.int64)] = True
+            mask &= keep
+        return np.flatnonzero(mask)
+
+    def _part(self, name: str, rows):
+        col = getattr(self, name.lstrip("-"))[rows]
+        return -col if name.startswith("-") else col
+
+    def _cursor(self, parts: tuple, after: tuple, code: str) -> list[int] | None:
+        """`after` (a route's Python sort key) as column values; None if it
+        does not fit this sort order."""
+        vals, pos = [], 0
+        try:
+            for name in parts:
+                if name == "-avg10":
+                    vals.append(round(after[pos] * 10))
+                    pos += 1
+                elif name == "-likes":
+                    vals.append(int(after[pos]))
+                    pos += 1
+                elif name == "cn" and code:
+                    vals.append(bisect_right(self.cn_keys, (code, str(after[pos]), len(self.cn))) - 1)
+                    pos += 1
+                else:
+                    keys = self.cn_keys if name == "cn" else self.nc_keys
+                    probe = (str(after[pos]), str(after[pos + 1]), len(self.cn))
+                    vals.append(bisect_right(keys, probe) - 1)
+                    pos += 2
+        except (IndexError, TypeError):
+            return None
+        return vals if pos == len(after) else None
+
+    def page(self, rows, parts: tuple, page: Page, key_of, code: str = "") -> tuple[list[int], dict]:
+        """Page.apply() over `rows` sorted by `parts`: returns (doc ids, meta).
+        key_of(doc id) gives the route's sort key for the next cursor; `code`
+        is set when the route's keys leave the country out."""
+        meta: dict = {}
+        if page.want_total:
+            meta["total"] = int(len(rows))
+        if page.after is not None:
+            after = self._cursor(parts, page.after, code)
+            if after is None:
+                return [], {**meta, "next_cursor": None}
+            gt = np.zeros(len(rows), dtype=bool)
+            for name, v in reversed(list(zip(parts, after))):
+                col = self._part(name, rows)
+                gt = (col > v) | ((col == v) & gt)
+            rows = rows[gt]
+        want = len(rows) if page.limit is None else page.limit + 1
+        cols = [self._part(name, rows) for name in parts]
+        if want < len(rows):
+            # Only rows tied with or ahead of the want-th on the first part can make the page.
+            cut = np.partition(cols[0], want - 1)[want - 1]
+            near = np.flatnonzero(cols[0] <= cut)
+            rows, cols = rows[near], [c[near] for c in cols]
+        order = np.lexsort(cols[::-1])[:want]
+        ids = rows[order].tolist()
+        if page.limit is None:
+            return ids, meta
+        more, ids = len(ids) > page.limit, ids[:page.limit]
+        meta["next_cursor"] = encode_cursor(key_of(ids[-1])) if more else None
+        return ids, meta
+
+
+_columns: Columns | None = None
+_columns_lock = threading.Lock()
+
+
+def columns() -> Columns | None:
+    """Columns for the current catalog, or None without NumPy or for catalogs
+    under COLUMNS_MIN_FOODS foods, where the plain loops are faster."""
+    global _columns
+    if np is None:
+        return None
+    index = get_index()
+    if len(index.docs) < COLUMNS_MIN_FOODS:
+        return None
+    c = _columns
+    if c is None or not c.current(index):
+        with _columns_lock:
+            c = _columns
+            if c is None or not c.current(index):
+                c = _columns = Columns(index)
+    return c
+
+
+def touch(key: str, step):
+    """After a like/rating write on `key`; `step` is data_store.write_step()."""
+    c = _columns
+    if c is not None:
+        c.touch(key, step)
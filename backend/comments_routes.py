@@ -1,10 +1,12 @@
 import secrets
 from time import time
-from flask import Blueprint, request, jsonify
-from store import comments_store, save_json
-from config import COMMENTS_JSON
+from flask import Blueprint, request, jsonify, current_app
+from store_backend import data_store
+from captcha import COOKIE as CAPTCHA_COOKIE
+import spam
+from config import CAPTCHA_TTL
 from helpers import (
-    current_user, err,
+    current_user, current_user_id, err, Page,
     kstr, rate_ok,
     get_captcha, verify_captcha,
     is_spam,
@@ -16,27 +18,55 @@ comments_bp = Blueprint("comments", __name__)
 @comments_bp.route("/api/captcha")
 def get_captcha_route():
     ip = request.remote_addr or "unknown"
-    return jsonify(get_captcha(ip))
+    body, token = get_captcha(ip)
+    resp = jsonify(body)
+    if token:
+        resp.set_cookie(CAPTCHA_COOKIE, token, max_age=CAPTCHA_TTL, httponly=True, samesite="Lax")
+    return resp
+
+
+def _public(c: dict) -> dict:
+    out = {k: v for k, v in c.items() if k != "delete_token"}
+    out.setdefault("replies", [])
+    return out
+
+
+# kstr -> (comment_version, threads newest first, encoded unpaged response).
+# Only foods that have comments are cached, so probing random names can't grow it.
+_thread_cache: dict[str, tuple[int, list, bytes]] = {}
+
+
+def _thread_view(key: str) -> tuple[int, list, bytes]:
+    version = data_store.comment_version(key)
+    hit = _thread_cache.get(key)
+    if hit and hit[0] == version:
+        return hit
+    children = data_store.comment_children(key)
+    threads = []
+    for c in sorted(children.get(None, []), key=lambda x: x.get("id", 0), reverse=True):
+        c_out = _public(c)
+        c_out["replies"] = [_public(r) for r in
+                            sorted(children.get(c["id"], []), key=lambda x: x.get("id", 0))]
+        threads.append(c_out)
+    body = current_app.json.dumps({"comments": threads}).encode("utf-8")
+    view = (version, threads, body)
+    if threads:
+        _thread_cache[key] = view
+    return view
 
 
 @comments_bp.route("/api/food/<code>/<name>/comments")
 def get_comments(code, name):
     key = kstr(code, name)
-    all_cmts = comments_store.get(key, [])
-    reply_map = {}
-    top_level = []
-    for c in all_cmts:
-        c_out = {k: v for k, v in c.items() if k != "delete_token"}
-        c_out.setdefault("replies", [])
-        pid = c.get("parent_id")
-        if pid:
-            reply_map.setdefault(pid, []).append(c_out)
-        else:
-            top_level.append(c_out)
-    for c in top_level:
-        c["replies"] = sorted(reply_map.get(c["id"], []), key=lambda x: x.get("id", 0))
-    top_level.sort(key=lambda x: x.get("id", 0), reverse=True)
-    return jsonify({"comments": top_level})
+    try:
+        page = Page.from_request()
+    except ValueError:
+        return err("cursor 無效")
+    _, threads, body = _thread_view(key)
+    if page.limit is None and not page.want_total:
+        return current_app.response_class(body, mimetype="application/json")
+    threads, meta = page.apply(threads, lambda x: (-x.get("id", 0),))
+    return jsonify({"comments": threads, **meta})
 
 
 @comments_bp.route("/api/food/<code>/<name>/comments", methods=["POST"])
@@ -60,7 +90,8 @@ def post_comment(code, name):
             given = int(body.get("captcha_answer", -999))
         except (ValueError, TypeError):
             given = -999
-        captcha_err = verify_captcha(ip, given)
+        token = body.get("captcha_token") or request.cookies.get(CAPTCHA_COOKIE, "")
+        captcha_err = verify_captcha(ip, given, token)
         if captcha_err == "驗證碼錯誤":
             return err(captcha_err, 400)
         elif captcha_err:
@@ -90,28 +121,25 @@ def post_comment(code, name):
     if anon:
         item["delete_token"] = secrets.token_hex(16)
 
-    comments_store.setdefault(key, []).append(item)
-    save_json(COMMENTS_JSON, comments_store)
+    data_store.add_comment(key, item)
+    spam.record(text)
     return jsonify(item), 201
 
 
 @comments_bp.route("/api/food/<code>/<name>/comments/<int:comment_id>", methods=["DELETE"])
 def delete_comment(code, name, comment_id):
-    key = kstr(code, name)
-    lst = comments_store.get(key, [])
-    idx = next((i for i, c in enumerate(lst) if c.get("id") == comment_id), None)
-    if idx is None:
+    key     = kstr(code, name)
+    comment = data_store.find_comment(key, comment_id)
+    if comment is None:
         return err("留言不存在", 404)
-    comment = lst[idx]
-    u = current_user()
-    if u and comment.get("user_id") == u.id:
+    uid = current_user_id()
+    if uid is not None and comment.get("user_id") == uid:
         pass
     else:
         token = (request.get_json(silent=True) or {}).get("token", "")
         if not token or token != comment.get("delete_token"):
             return err("無權刪除", 403)
-    lst.pop(idx)
-    save_json(COMMENTS_JSON, comments_store)
+    data_store.remove_comment(key, comment_id)
     return jsonify({"ok": True})
 
 
@@ -121,9 +149,7 @@ def like_comment(code, name, comment_id):
     ok_rate, retry = rate_ok("comment_like", f"{key}:{comment_id}")
     if not ok_rate:
         return err("操作太頻繁", 429, retry_after=retry)
-    for c in comments_store.get(key, []):
-        if c.get("id") == comment_id:
-            c["likes"] = c.get("likes", 0) + 1
-            save_json(COMMENTS_JSON, comments_store)
-            return jsonify({"likes": c["likes"]})
-    return err("留言不存在", 404)
+    likes = data_store.bump_comment_likes(key, comment_id)
+    if likes is None:
+        return err("留言不存在", 404)
+    return jsonify({"likes": likes})
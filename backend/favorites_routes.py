@@ -1,31 +1,67 @@
 from flask import Blueprint, request, jsonify
-from models import User, Favorite, FavoriteList, db
-from helpers import current_user, err
+from sqlalchemy import and_, null, select, tuple_, union_all
+from config import FAVORITES_BATCH_MAX
+from models import User, Favorite, FavoriteList, db, insert_ignore
+from helpers import current_user_id, err
 
 favorites_bp = Blueprint("favorites", __name__)
 
 
 @favorites_bp.route("/api/favorites")
 def get_favorites():
-    u = current_user()
-    if not u:
+    uid = current_user_id()
+    if uid is None:
         return err("未授權", 401)
-    return jsonify({"favorites": [f.to_dict() for f in Favorite.query.filter_by(user_id=u.id)]})
+    if request.args.get("with_lists") in ("1", "true"):
+        return jsonify(_favorites_by_list(uid))
+    return jsonify({"favorites": [f.to_dict() for f in Favorite.query.filter_by(user_id=uid)]})
+
+
+def _favorites_by_list(uid: int) -> dict:
+    """Every list with its favorites, plus the unlisted ones, in one query:
+    lists LEFT JOIN favorites, UNION ALL favorites without a list."""
+    listed = (
+        select(FavoriteList.id, FavoriteList.name,
+               Favorite.id, Favorite.country_code, Favorite.food_name)
+        .select_from(FavoriteList)
+        .outerjoin(Favorite, and_(Favorite.list_id == FavoriteList.id, Favorite.user_id == uid))
+        .where(FavoriteList.user_id == uid)
+    )
+    unlisted = (
+        select(null(), null(), Favorite.id, Favorite.country_code, Favorite.food_name)
+        .where(Favorite.user_id == uid, Favorite.list_id.is_(None))
+    )
+    lists: dict[int, dict] = {}
+    loose = []
+    for list_id, list_name, fav_id, code, name in db.session.execute(union_all(listed, unlisted)):
+        fav = None if fav_id is None else {
+            "id": fav_id, "country_code": code, "food_name": name, "list_id": list_id,
+        }
+        if list_id is None:
+            loose.append(fav)
+            continue
+        entry = lists.setdefault(list_id, {"id": list_id, "name": list_name, "favorites": []})
+        if fav:
+            entry["favorites"].append(fav)
+    for entry in lists.values():
+        entry["favorites"].sort(key=lambda f: f["id"])
+    loose.sort(key=lambda f: f["id"])
+    return {"lists": sorted(lists.values(), key=lambda fl: fl["id"]), "unlisted": loose}
 
 
 @favorites_bp.route("/api/favorites", methods=["POST"])
 def add_favorite():
-    u = current_user()
-    if not u:
+    uid = current_user_id()
+    if uid is None:
         return err("未授權", 401)
     body = request.get_json(silent=True) or {}
     code = (body.get("country_code") or "").upper().strip()
     name = (body.get("food_name") or "").strip()
     if not code or not name:
         return err("country_code 和 food_name 為必填")
-    if Favorite.query.filter_by(user_id=u.id, country_code=code, food_name=name).first():
+    if Favorite.query.filter_by(user_id=uid, country_code=code, food_name=name).first():
         return err("已收藏", 409)
-    fav = Favorite(user_id=u.id, country_code=code, food_name=name)
+    fav = Favorite(user_id=uid, country_code=code, food_name=name)
     db.session.add(fav)
     db.session.commit()
     return jsonify(fav.to_dict()), 201
@@ -33,13 +69,13 @@ def add_favorite():
 
 @favorites_bp.route("/api/favorites", methods=["DELETE"])
 def remove_favorite():
-    u = current_user()
-    if not u:
+    uid = current_user_id()
+    if uid is None:
         return err("未授權", 401)
     body = request.get_json(silent=True) or {}
     code = (body.get("country_code") or "").upper().strip()
     name = (body.get("food_name") or "").strip()
-    fav  = Favorite.query.filter_by(user_id=u.id, country_code=code, food_name=name).first()
+    fav  = Favorite.query.filter_by(user_id=uid, country_code=code, food_name=name).first()
     if not fav:
         return err("未找到", 404)
     db.session.delete(fav)
@@ -47,61 +83,167 @@ def remove_favorite():
     return jsonify({"ok": True})
 
 
-@favorites_bp.route("/api/favorites/batch", methods=["POST"])
-def batch_favorites():
-    u = current_user()
-    if not u:
-        return err("未授權", 401)
-    items = (request.get_json(silent=True) or {}).get("items", [])
-    added = 0
-    for item in items:
-        code = (item.get("country_code") or "").upper().strip()
-        name = (item.get("food_name") or "").strip()
-        if code and name and not Favorite.query.filter_by(
-                user_id=u.id, country_code=code, food_name=name).first():
-            db.session.add(Favorite(user_id=u.id, country_code=code, food_name=name))
-            added += 1
-    db.session.commit()
-    return jsonify({"added": added})
-
-
 @favorites_bp.route("/api/favorites/move", methods=["PUT"])
 def move_favorite():
-    u = current_user()
-    if not u:
+    uid = current_user_id()
+    if uid is None:
         return err("未授權", 401)
     body    = request.get_json(silent=True) or {}
     fav_id  = body.get("favorite_id")
     list_id = body.get("list_id")
-    fav = Favorite.query.filter_by(id=fav_id, user_id=u.id).first()
+    fav = Favorite.query.filter_by(id=fav_id, user_id=uid).first()
     if not fav:
         return err("未找到", 404)
     if list_id is not None:
-        if not FavoriteList.query.filter_by(id=list_id, user_id=u.id).first():
+        if not FavoriteList.query.filter_by(id=list_id, user_id=uid).first():
             return err("清單不存在", 404)
     fav.list_id = list_id
     db.session.commit()
     return jsonify(fav.to_dict())
 
 
+# ── Bulk ───────────────────────────────────────────────────────────
+# Every bulk endpoint answers with one status per input item, in input order,
+# and costs a constant number of queries regardless of batch size.
+def _batch_list(body: dict, field: str, default=None):
+    """body[field] (or `default` when absent) as a list, or an error response."""
+    items = body.get(field, default)
+    if not isinstance(items, list):
+        return None, err(f"{field} 需為陣列")
+    if len(items) > FAVORITES_BATCH_MAX:
+        return None, err(f"一次最多 {FAVORITES_BATCH_MAX} 筆", 413)
+    return items, None
+
+
+def _parse_pairs(items: list) -> tuple[dict[tuple[str, str], int], list[str]]:
+    """{(code, name): index of first occurrence}, and statuses pre-filled for
+    invalid and repeated items."""
+    pairs: dict[tuple[str, str], int] = {}
+    results = [""] * len(items)
+    for i, item in enumerate(items):
+        item = item if isinstance(item, dict) else {}
+        code = (item.get("country_code") or "").upper().strip()
+        name = (item.get("food_name") or "").strip()
+        if not code or not name:
+            results[i] = "invalid"
+        elif (code, name) in pairs:
+            results[i] = "duplicate"
+        else:
+            pairs[(code, name)] = i
+    return pairs, results
+
+
+def _existing(uid: int, pairs) -> dict[tuple[str, str], int]:
+    """(code, name) -> favorite id for those of `pairs` the user already has."""
+    if not pairs:
+        return {}
+    rows = db.session.execute(
+        select(Favorite.country_code, Favorite.food_name, Favorite.id).where(
+            Favorite.user_id == uid,
+            tuple_(Favorite.country_code, Favorite.food_name).in_(list(pairs)),
+        )
+    )
+    return {(code, name): fid for code, name, fid in rows}
+
+
+def _parse_ids(items: list) -> tuple[dict[int, int], list[str]]:
+    ids: dict[int, int] = {}
+    results = [""] * len(items)
+    for i, fid in enumerate(items):
+        if not isinstance(fid, int) or isinstance(fid, bool):
+            results[i] = "invalid"
+        elif fid in ids:
+            results[i] = "duplicate"
+        else:
+            ids[fid] = i
+    return ids, results
+
+
+@favorites_bp.route("/api/favorites/batch", methods=["POST"])
+def batch_favorites():
+    uid = current_user_id()
+    if uid is None:
+        return err("未授權", 401)
+    # No "items" is an empty batch, as it always was for this endpoint.
+    items, error = _batch_list(request.get_json(silent=True) or {}, "items", [])
+    if error:
+        return error
+    pairs, results = _parse_pairs(items)
+    have = _existing(uid, pairs)
+    rows = [{"user_id": uid, "country_code": code, "food_name": name}
+            for code, name in pairs if (code, name) not in have]
+    # ON CONFLICT DO NOTHING covers a concurrent request adding the same pair;
+    # such a pair comes back from neither query and so counts as "exists".
+    added = set(insert_ignore(Favorite, rows, ("country_code", "food_name")))
+    for pair, i in pairs.items():
+        results[i] = "added" if pair in added else "exists"
+    db.session.commit()
+    return jsonify({"added": len(added), "results": results})
+
+
+@favorites_bp.route("/api/favorites/batch", methods=["DELETE"])
+def batch_remove_favorites():
+    uid = current_user_id()
+    if uid is None:
+        return err("未授權", 401)
+    items, error = _batch_list(request.get_json(silent=True) or {}, "items")
+    if error:
+        return error
+    pairs, results = _parse_pairs(items)
+    have = _existing(uid, pairs)
+    for pair, i in pairs.items():
+        results[i] = "deleted" if pair in have else "not_found"
+    if have:
+        db.session.execute(db.delete(Favorite).where(
+            Favorite.user_id == uid, Favorite.id.in_(list(have.values()))))
+    db.session.commit()
+    return jsonify({"deleted": len(have), "results": results})
+
+
+@favorites_bp.route("/api/favorites/move/batch", methods=["PUT"])
+def batch_move_favorites():
+    uid = current_user_id()
+    if uid is None:
+        return err("未授權", 401)
+    body = request.get_json(silent=True) or {}
+    items, error = _batch_list(body, "favorite_ids")
+    if error:
+        return error
+    list_id = body.get("list_id")
+    if list_id is not None:
+        if not FavoriteList.query.filter_by(id=list_id, user_id=uid).first():
+            return err("清單不存在", 404)
+    ids, results = _parse_ids(items)
+    mine = set(db.session.execute(
+        select(Favorite.id).where(Favorite.user_id == uid, Favorite.id.in_(list(ids)))
+    ).scalars()) if ids else set()
+    for fid, i in ids.items():
+        results[i] = "moved" if fid in mine else "not_found"
+    if mine:
+        db.session.execute(db.update(Favorite).where(
+            Favorite.user_id == uid, Favorite.id.in_(list(mine))).values(list_id=list_id))
+    db.session.commit()
+    return jsonify({"moved": len(mine), "results": results})
+
+
 @favorites_bp.route("/api/favorite-lists")
 def get_fav_lists():
-    u = current_user()
-    if not u:
+    uid = current_user_id()
+    if uid is None:
         return err("未授權", 401)
-    lists = FavoriteList.query.filter_by(user_id=u.id).all()
+    lists = FavoriteList.query.filter_by(user_id=uid).all()
     return jsonify({"lists": [{"id": l.id, "name": l.name} for l in lists]})
 
 
 @favorites_bp.route("/api/favorite-lists", methods=["POST"])
 def create_fav_list():
-    u = current_user()
-    if not u:
+    uid = current_user_id()
+    if uid is None:
         return err("未授權", 401)
     name = ((request.get_json(silent=True) or {}).get("name") or "").strip()
     if not name:
         return err("name 為必填")
-    fl = FavoriteList(user_id=u.id, name=name)
+    fl = FavoriteList(user_id=uid, name=name)
     db.session.add(fl)
     db.session.commit()
     return jsonify({"id": fl.id, "name": fl.name}), 201
@@ -109,10 +251,10 @@ def create_fav_list():
 
 @favorites_bp.route("/api/favorite-lists/<int:list_id>", methods=["PUT"])
 def rename_fav_list(list_id):
-    u = current_user()
-    if not u:
+    uid = current_user_id()
+    if uid is None:
         return err("未授權", 401)
-    fl = FavoriteList.query.filter_by(id=list_id, user_id=u.id).first()
+    fl = FavoriteList.query.filter_by(id=list_id, user_id=uid).first()
     if not fl:
         return err("未找到", 404)
     name = ((request.get_json(silent=True) or {}).get("name") or "").strip()
@@ -125,13 +267,13 @@ def rename_fav_list(list_id):
 
 @favorites_bp.route("/api/favorite-lists/<int:list_id>", methods=["DELETE"])
 def delete_fav_list(list_id):
-    u = current_user()
-    if not u:
+    uid = current_user_id()
+    if uid is None:
         return err("未授權", 401)
-    fl = FavoriteList.query.filter_by(id=list_id, user_id=u.id).first()
+    fl = FavoriteList.query.filter_by(id=list_id, user_id=uid).first()
     if not fl:
         return err("未找到", 404)
-    Favorite.query.filter_by(user_id=u.id, list_id=list_id).update({"list_id": None})
+    Favorite.query.filter_by(user_id=uid, list_id=list_id).update({"list_id": None})
     db.session.delete(fl)
     db.session.commit()
     return jsonify({"ok": True})
@@ -1,11 +1,15 @@
 from flask import Blueprint, request, jsonify
 from urllib.parse import unquote
-from store import likes_store, ratings_store, save_json, load_foods_json
-from config import FOODS_JSON, LIKES_JSON, RATINGS_JSON, COUNTRY_MAP
+import catalog_columns, images, leaderboard
+from store import save_json, load_foods_json, file_lock
+from store_backend import data_store
+from response_cache import cached, catalog_version
+from search_index import get_index
+from config import FOODS_JSON, COUNTRY_MAP
 from helpers import (
-    current_user, err,
+    current_user_id, err, Page,
     kstr, resolve_country_block,
-    like_entry, liker_id, like_count,
+    liker_id, like_count,
     rater_key, rating_stats,
 )
 
@@ -13,32 +17,55 @@ foods_bp = Blueprint("foods", __name__)
 
 
 @foods_bp.route("/api/foods/<code>")
+@cached(lambda code: (catalog_version(), data_store.counter_version(code.upper())))
 def get_country_foods(code):
     data = load_foods_json()
     code_up, country_name, block = resolve_country_block(code, data)
     if not country_name:
         return err("Country not found", 404)
-    enriched = []
-    for f in block.get("foods", []):
-        fname = f.get("name", "")
-        key   = kstr(code_up, fname)
-        stats = rating_stats(key)
-        enriched.append({
-            "name":         fname,
-            "img":          f.get("img"),
-            "likes":        like_count(key),
-            "tags":         f.get("tags", []),
-            "avg_rating":   stats["avg"],
-            "rating_count": stats["count"],
-        })
-    enriched.sort(key=lambda x: x["likes"], reverse=True)
-    return jsonify({"foods": enriched})
+    try:
+        page = Page.from_request()
+    except ValueError:
+        return err("cursor 無效")
+    sort_by  = request.args.get("sort", "likes")
+    sort_key = _FOOD_SORTS.get(sort_by, _FOOD_SORTS["likes"])
+    cols     = catalog_columns.columns()
+    if cols is not None and code_up in cols.country_ids and country_name == COUNTRY_MAP.get(code_up):
+        docs = cols.index.docs
+        ids, meta = cols.page(cols.select(country=code_up),
+                              catalog_columns.FOOD_SORTS.get(sort_by, catalog_columns.FOOD_SORTS["likes"]),
+                              page, lambda i: sort_key(_food_row(code_up, docs[i].food)), code=code_up)
+        return jsonify({"foods": [_food_row(code_up, docs[i].food) for i in ids], **meta})
+    enriched = [_food_row(code_up, f) for f in block.get("foods", [])]
+    foods, meta = page.apply(enriched, sort_key)
+    return jsonify({"foods": foods, **meta})
+
+
+def _food_row(code: str, f: dict) -> dict:
+    fname = f.get("name", "")
+    key   = kstr(code, fname)
+    stats = rating_stats(key)
+    return {
+        "name":         fname,
+        "img":          f.get("img"),
+        "img_variants": images.variants(f.get("img")),
+        "likes":        like_count(key),
+        "tags":         f.get("tags", []),
+        "avg_rating":   stats["avg"],
+        "rating_count": stats["count"],
+    }
+
+
+_FOOD_SORTS = {
+    "likes":  lambda x: (-x["likes"], x["name"]),
+    "rating": lambda x: (-x["avg_rating"], -x["likes"], x["name"]),
+    "name":   lambda x: (x["name"],),
+}
 
 
 @foods_bp.route("/api/foods/<code>", methods=["POST"])
 def add_food(code):
-    u = current_user()
-    if not u:
+    if current_user_id() is None:
         return err("請先登入", 401)
 
     body = request.get_json(silent=True) or {}
@@ -54,20 +81,24 @@ def add_food(code):
     if len(desc) > 500:
         return err("描述過長（最多 500 字）")
 
-    data = load_foods_json()
-    code_up, country_name, block = resolve_country_block(code, data)
-    if not country_name:
-        return err("國家不存在", 404)
-
-    foods = block.get("foods", [])
-    if any(f.get("name", "").lower() == name.lower() for f in foods):
-        return err("此食物名稱已存在")
-
-    new_food = {"name": name, "desc": desc, "img": img, "tags": tags}
-    foods.append(new_food)
-    data[country_name]["foods"] = foods
-    save_json(FOODS_JSON, data)
-    load_foods_json(force=True)
+    # Read-modify-write of the whole file: serialize it across threads and
+    # workers, starting from what is on disk rather than the watcher's copy.
+    with file_lock(FOODS_JSON):
+        data = load_foods_json(force=True)
+        code_up, country_name, block = resolve_country_block(code, data)
+        if not country_name:
+            return err("國家不存在", 404)
+
+        foods = block.get("foods", [])
+        if any(f.get("name", "").lower() == name.lower() for f in foods):
+            return err("此食物名稱已存在")
+
+        # Build a new catalog rather than appending to the one being served.
+        new_food = {"name": name, "desc": desc, "img": img, "tags": tags}
+        data = dict(data)
+        data[country_name] = dict(block, foods=foods + [new_food])
+        save_json(FOODS_JSON, data)
+        load_foods_json(force=True)
 
     return jsonify({
         "name": name, "img": img, "tags": tags,
@@ -84,49 +115,30 @@ def get_food_detail(code, name):
     target = unquote(name).strip()
     for f in block.get("foods", []):
         if f.get("name") == target:
-            return jsonify(f)
+            return jsonify({**f, "img_variants": images.variants(f.get("img"))})
     return err("Food not found", 404)
 
 
 @foods_bp.route("/api/food/<code>/<name>/likes")
 def get_likes(code, name):
-    key   = kstr(code, name)
-    entry = like_entry(key)
-    u     = current_user()
-    liked = liker_id(u) in entry.get("liked_by", [])
-    return jsonify({"likes": int(entry.get("count", 0)), "liked": liked})
+    key          = kstr(code, name)
+    count, liked = data_store.like_state(key, liker_id(current_user_id()))
+    return jsonify({"likes": count, "liked": liked})
 
 
 @foods_bp.route("/api/food/<code>/<name>/like", methods=["POST"])
 def post_like(code, name):
-    key      = kstr(code, name)
-    u        = current_user()
-    lk       = liker_id(u)
-    entry    = like_entry(key)
-    liked_by = list(entry.get("liked_by", []))
-    count    = int(entry.get("count", 0))
-    if lk in liked_by:
-        liked_by.remove(lk)
-        count = max(0, count - 1)
-        liked = False
-    else:
-        liked_by.append(lk)
-        count += 1
-        liked = True
-    likes_store[key] = {"count": count, "liked_by": liked_by}
-    save_json(LIKES_JSON, likes_store)
+    key          = kstr(code, name)
+    count, liked = data_store.toggle_like(key, liker_id(current_user_id()))
+    _counted(key, 1 if liked else -1)
     return jsonify({"likes": count, "liked": liked})
 
 
 @foods_bp.route("/api/food/<code>/<name>/rating")
 def get_rating(code, name):
     key   = kstr(code, name)
-    u     = current_user()
-    rk    = rater_key(u)
-    entry = ratings_store.get(key) or {}
-    ur    = entry.get("user_ratings", {})
     stats = rating_stats(key)
-    stats["my_rating"] = ur.get(rk, 0)
+    stats["my_rating"] = data_store.my_rating(key, rater_key(current_user_id()))
     return jsonify(stats)
 
 
@@ -139,50 +151,36 @@ def post_rating(code, name):
         return err("rating 需為 1-5 的整數")
     if not (1 <= stars <= 5):
         return err("rating 需為 1-5 的整數")
-    u  = current_user()
-    rk = rater_key(u)
-    ratings_store.setdefault(key, {"user_ratings": {}})
-    ratings_store[key].setdefault("user_ratings", {})[rk] = stars
-    save_json(RATINGS_JSON, ratings_store)
+    old = data_store.set_rating(key, rater_key(current_user_id()), stars)
+    _counted(key, 1.5 * (stars - old))
     stats = rating_stats(key)
     stats["my_rating"] = stars
     return jsonify(stats)
 
 
+def _counted(key: str, weight: float):
+    """This thread just changed a like/rating total of `key`."""
+    step = data_store.write_step()
+    leaderboard.touch(key, step, weight)
+    catalog_columns.touch(key, step)
+
+
 @foods_bp.route("/api/food/<code>/<name>/related")
+@cached(lambda code, name: (catalog_version(), data_store.counter_version()))
 def get_related_foods(code, name):
-    data = load_foods_json()
-    code_up, country_name, block = resolve_country_block(code, data)
-    target = unquote(name).strip()
-    current_tags = set()
-    if block:
-        for f in block.get("foods", []):
-            if f.get("name") == target:
-                current_tags = set(f.get("tags", []))
-                break
+    key = kstr(code, unquote(name).strip())
     results = []
-    for c, cn in COUNTRY_MAP.items():
-        b = data.get(cn) or data.get(c)
-        if not b:
-            continue
-        for f in b.get("foods", []):
-            if c == code_up and f.get("name") == target:
-                continue
-            ftags = set(f.get("tags", []))
-            common = len(current_tags & ftags)
-            if common == 0 and current_tags:
-                continue
-            key = kstr(c, f["name"])
-            stats = rating_stats(key)
-            results.append({
-                "code":        c,
-                "countryName": cn,
-                "name":        f["name"],
-                "img":         f.get("img"),
-                "tags":        f.get("tags", []),
-                "likes":       like_count(key),
-                "avg_rating":  stats["avg"],
-                "common_tags": common,
-            })
-    results.sort(key=lambda x: (-x["common_tags"], -x["likes"]))
-    return jsonify({"related": results[:4]})
+    for doc, common in get_index().related(key, 4, lambda d: like_count(d.key)):
+        f = doc.food
+        results.append({
+            "code":         doc.code,
+            "countryName":  doc.country_name,
+            "name":         f["name"],
+            "img":          f.get("img"),
+            "img_variants": images.variants(f.get("img")),
+            "tags":         f.get("tags", []),
+            "likes":        like_count(doc.key),
+            "avg_rating":   rating_stats(doc.key)["avg"],
+            "common_tags":  common,
+        })
+    return jsonify({"related": results})
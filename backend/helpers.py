@@ -1,16 +1,18 @@
 from __future__ import annotations
-import re, random, secrets
-from collections import defaultdict
+import base64, heapq, json, secrets, threading
+from collections import OrderedDict
 from datetime import datetime, timedelta, timezone
 from time import time
 from urllib.parse import unquote
 
-import jwt as _jwt
 from flask import jsonify, request, make_response
 
-from config import JWT_SECRET, JWT_EXP_DAYS, COUNTRY_MAP
+from config import JWT_SECRET, JWT_EXP_DAYS, SESSION_CACHE_TTL, SESSION_CACHE_SIZE, COUNTRY_MAP
 from models import User, db
-from store import likes_store, ratings_store
+from store_backend import data_store
+from rate_limit import limiter
+from captcha import captcha
+import spam
 
 
 # ── API Response Helpers ────────────────────────────────────────────
@@ -21,7 +23,10 @@ def err(message: str, status: int = 400, **extra):
 
 
 # ── JWT ────────────────────────────────────────────────────────────
+# PyJWT is imported on first use: most requests are answered from the
+# token cache without it.
 def make_token(user_id: int) -> str:
+    import jwt as _jwt
     payload = {
         "user_id": user_id,
         "exp": datetime.now(timezone.utc) + timedelta(days=JWT_EXP_DAYS),
@@ -29,20 +34,108 @@ def make_token(user_id: int) -> str:
     return _jwt.encode(payload, JWT_SECRET, algorithm="HS256")
 
 
-def current_user() -> User | None:
+def request_token() -> str:
     # Try httpOnly cookie first, then Authorization header fallback
     token = request.cookies.get("auth_token", "")
     if not token:
         auth = request.headers.get("Authorization", "")
         if auth.startswith("Bearer "):
             token = auth[7:]
+    return token
+
+
+class SessionUser:
+    """Read-only snapshot of a User row; use current_user_row() to modify one."""
+    __slots__ = ("id", "email", "display_name")
+
+    def __init__(self, u: User):
+        self.id           = u.id
+        self.email        = u.email
+        self.display_name = u.display_name
+
+    def to_dict(self):
+        return {"id": self.id, "email": self.email, "display_name": self.display_name}
+
+
+# token -> (deadline, user_id) and user_id -> (deadline, SessionUser), both LRU.
+# A token entry never outlives the token's own exp.
+_token_cache: OrderedDict[str, tuple[float, int]]         = OrderedDict()
+_user_cache:  OrderedDict[int, tuple[float, SessionUser]] = OrderedDict()
+_session_lock = threading.Lock()
+
+
+def _cache_get(cache: OrderedDict, key):
+    with _session_lock:
+        hit = cache.get(key)
+        if hit is None:
+            return None
+        if hit[0] <= time():
+            del cache[key]
+            return None
+        cache.move_to_end(key)
+        return hit[1]
+
+
+def _cache_put(cache: OrderedDict, key, deadline: float, value):
+    with _session_lock:
+        cache[key] = (deadline, value)
+        cache.move_to_end(key)
+        while len(cache) > SESSION_CACHE_SIZE:
+            cache.popitem(last=False)
+
+
+def _session_user(uid: int) -> SessionUser | None:
+    snap = _cache_get(_user_cache, uid)
+    if snap is None:
+        u = db.session.get(User, uid)
+        if u is None:
+            return None
+        snap = SessionUser(u)
+        _cache_put(_user_cache, uid, time() + SESSION_CACHE_TTL, snap)
+    return snap
+
+
+def current_user_id() -> int | None:
+    """Id from a verified token of a user that still exists; the database is
+    only asked on a token-cache miss, at most once per SESSION_CACHE_TTL."""
+    token = request_token()
     if not token:
         return None
+    uid = _cache_get(_token_cache, token)
+    if uid is not None:
+        return uid
+    import jwt as _jwt
     try:
         payload = _jwt.decode(token, JWT_SECRET, algorithms=["HS256"])
-        return db.session.get(User, payload["user_id"])
+        uid = int(payload["user_id"])
     except Exception:
         return None
+    if _session_user(uid) is None:
+        return None  # account deleted since the token was issued
+    deadline = min(time() + SESSION_CACHE_TTL, payload.get("exp", 0))
+    _cache_put(_token_cache, token, deadline, uid)
+    return uid
+
+
+def current_user() -> SessionUser | None:
+    uid = current_user_id()
+    return _session_user(uid) if uid is not None else None
+
+
+def current_user_row() -> User | None:
+    uid = current_user_id()
+    return db.session.get(User, uid) if uid is not None else None
+
+
+def forget_user(user_id: int):
+    """Drop the cached snapshot after the User row changed."""
+    with _session_lock:
+        _user_cache.pop(user_id, None)
+
+
+def forget_token(token: str):
+    with _session_lock:
+        _token_cache.pop(token, None)
 
 
 def set_auth_cookie(response, token: str):
@@ -61,61 +154,97 @@ def clear_auth_cookie(response):
     return response
 
 
-# ── Rate Limiting ──────────────────────────────────────────────────
-_rate_ts: dict[str, float] = defaultdict(float)
-_RATE_WINDOW = {
-    "like":         2,
-    "comment_anon": 30,
-    "comment_auth": 5,
-    "comment_like": 2,
-}
+# ── Pagination ─────────────────────────────────────────────────────
+DEFAULT_PAGE = 20
+MAX_PAGE     = 100
 
 
-def rate_ok(action: str, extra: str = "") -> tuple[bool, int]:
-    ip  = request.remote_addr or "unknown"
-    key = f"{action}:{ip}:{extra}"
-    now = time()
-    window = _RATE_WINDOW.get(action, 2)
-    elapsed = now - _rate_ts[key]
-    if elapsed < window:
-        return False, int(window - elapsed) + 1
-    _rate_ts[key] = now
-    return True, 0
+def encode_cursor(sort_key: tuple) -> str:
+    raw = json.dumps(sort_key, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
 
 
-# ── CAPTCHA ────────────────────────────────────────────────────────
-_captcha_store: dict[str, tuple[int, float]] = {}
+def decode_cursor(cursor: str) -> tuple:
+    """Raises ValueError for anything encode_cursor() did not produce."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        key = json.loads(raw)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError("bad cursor") from e
+    if not isinstance(key, list):
+        raise ValueError("bad cursor")
+    return tuple(key)
+
+
+class Page:
+    """?limit=&cursor=&total=1 for list endpoints.
+
+    The cursor is the sort key of the last item served, so pages stay stable
+    while items are added; the sort key must therefore be unique per item.
+    Without limit or cursor the whole list is returned, as before.
+    """
+
+    def __init__(self, limit: int | None, after: tuple | None, want_total: bool):
+        self.limit      = limit
+        self.after      = after
+        self.want_total = want_total
+
+    @classmethod
+    def from_request(cls) -> "Page":
+        cursor = request.args.get("cursor")
+        after  = decode_cursor(cursor) if cursor else None
+        limit  = None
+        if request.args.get("limit") is not None or after is not None:
+            try:
+                limit = int(request.args.get("limit", DEFAULT_PAGE))
+            except ValueError:
+                limit = DEFAULT_PAGE
+            limit = min(max(1, limit), MAX_PAGE)
+        want_total = request.args.get("total") in ("1", "true")
+        return cls(limit, after, want_total)
+
+    def apply(self, items, key) -> tuple[list, dict]:
+        """Returns (page, meta); meta holds next_cursor and total when asked for."""
+        items = list(items)
+        meta: dict = {}
+        if self.want_total:
+            meta["total"] = len(items)
+        if self.limit is None:
+            return sorted(items, key=key), meta
+        pool = items
+        if self.after is not None:
+            try:
+                pool = [x for x in items if key(x) > self.after]
+            except TypeError:
+                pool = []  # cursor from a different sort order
+        top = heapq.nsmallest(self.limit + 1, pool, key=key)
+        more, top = len(top) > self.limit, top[:self.limit]
+        meta["next_cursor"] = encode_cursor(key(top[-1])) if more else None
+        return top, meta
+
+
+# ── Rate Limiting ──────────────────────────────────────────────────
+def rate_ok(action: str, extra: str = "") -> tuple[bool, int]:
+    """(allowed, seconds to wait) for this client; limits are in rate_limit.LIMITS."""
+    ip = request.remote_addr or "unknown"
+    return limiter.hit(f"{action}:{ip}:{extra}", action)
 
 
-def get_captcha(ip: str) -> dict:
-    a, b = random.randint(1, 9), random.randint(1, 9)
-    _captcha_store[ip] = (a + b, time() + 120)
-    return {"question": f"{a} + {b} = ?", "expires_in": 120}
+# ── CAPTCHA ────────────────────────────────────────────────────────
+def get_captcha(ip: str) -> tuple[dict, str | None]:
+    """(response body, token to set as the captcha cookie or None)."""
+    return captcha.issue(ip)
 
 
-def verify_captcha(ip: str, given: int):
+def verify_captcha(ip: str, given: int, token: str = ""):
     """Returns None if ok, or error string if failed."""
-    entry = _captcha_store.get(ip)
-    if not entry:
-        return "請先取得驗證碼"
-    expected, expires = entry
-    if time() > expires:
-        _captcha_store.pop(ip, None)
-        return "驗證碼已過期，請重新取得"
-    if given != expected:
-        return "驗證碼錯誤"
-    _captcha_store.pop(ip, None)
-    return None
+    return captcha.verify(ip, given, token)
 
 
 # ── Spam Detection ─────────────────────────────────────────────────
 def is_spam(text: str) -> bool:
-    if re.search(r"(.)\1{6,}", text):
-        return True
-    ascii_alpha = [c for c in text if c.isascii() and c.isalpha()]
-    if len(ascii_alpha) > 8 and sum(c.isupper() for c in ascii_alpha) / len(ascii_alpha) > 0.7:
-        return True
-    return False
+    """Rules and thresholds live in spam.py."""
+    return spam.pipeline().is_spam(text)
 
 
 # ── Country / Food Helpers ─────────────────────────────────────────
@@ -134,28 +263,21 @@ def resolve_country_block(code: str, data: dict):
 
 
 # ── Like Helpers ───────────────────────────────────────────────────
-def like_entry(key: str) -> dict:
-    raw = likes_store.get(key, 0)
-    if isinstance(raw, int):
-        return {"count": raw, "liked_by": []}
-    return raw
-
-
-def liker_id(u) -> str:
-    return f"user:{u.id}" if u else f"ip:{request.remote_addr or 'unknown'}"
+def liker_id(user_id: int | None) -> str:
+    return f"user:{user_id}" if user_id is not None else f"ip:{request.remote_addr or 'unknown'}"
 
 
 def like_count(key: str) -> int:
-    return int(like_entry(key).get("count", 0))
+    return data_store.food_agg(key).likes
 
 
 # ── Rating Helpers ─────────────────────────────────────────────────
-def rater_key(u) -> str:
-    return f"user:{u.id}" if u else f"ip:{request.remote_addr or 'unknown'}"
+def rater_key(user_id: int | None) -> str:
+    return f"user:{user_id}" if user_id is not None else f"ip:{request.remote_addr or 'unknown'}"
 
 
 def rating_stats(key: str) -> dict:
-    vals = list((ratings_store.get(key) or {}).get("user_ratings", {}).values())
-    if not vals:
+    a = data_store.food_agg(key)
+    if not a.rating_count:
         return {"avg": 0.0, "count": 0}
-    return {"avg": round(sum(vals) / len(vals), 1), "count": len(vals)}
+    return {"avg": round(a.rating_sum / a.rating_count, 1), "count": a.rating_count}
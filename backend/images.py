@@ -0,0 +1,206 @@
+from __future__ import annotations
+import hashlib, os, re, sys, threading
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:  # optional: without Pillow every variant is the original file
+    Image = None
+from config import STATIC_DIR, IMAGE_CACHE_DIR
+from search_index import SearchIndex, get_index
+
+# Variant -> longest side in pixels; "full" is always the source file itself.
+VARIANTS = {"thumb": 320, "medium": 960}
+URL_PREFIX = "/api/img/"
+_EXT = "webp" if Image is not None and features.check("webp") else "jpg"
+_SOURCE_EXTS = {".jpg", ".jpeg", ".png", ".webp", ".gif"}
+_NAME = re.compile(r"([0-9a-f]{16})-(\w+)(\.\w+)")
+
+
+# ── Sources ────────────────────────────────────────────────────────
+# URLs are content-addressed: <digest of the source bytes>-<variant>.<ext>,
+# so a URL never changes meaning and can be cached forever. Digests are
+# recomputed only when a file's (mtime, size) changes.
+_known: dict[str, tuple[tuple[int, int], str, Path]] = {}  # img URL -> (sig, digest, file)
+_lock = threading.Lock()
+
+
+def _digest(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            h.update(chunk)
+    return h.hexdigest()[:16]
+
+
+def source(img: str | None) -> tuple[str, Path] | None:
+    """(digest, file) for a local /static/... image URL, None for anything
+    else. Stats the file (and hashes it if new), so responses use catalog()."""
+    if not img or not img.startswith("/static/"):
+        return None
+    path = (STATIC_DIR / img[len("/static/"):]).resolve()
+    if STATIC_DIR.resolve() not in path.parents or path.suffix.lower() not in _SOURCE_EXTS:
+        return None
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    sig = (st.st_mtime_ns, st.st_size)
+    hit = _known.get(img)
+    if hit is None or hit[0] != sig:
+        hit = (sig, _digest(path), path)
+        with _lock:
+            _known[img] = hit
+    return hit[1], hit[2]
+
+
+def _urls(digest: str, path: Path) -> dict:
+    full = f"{URL_PREFIX}{digest}-full{path.suffix.lower()}"
+    if Image is None:
+        return {"thumb": full, "medium": full, "full": full}
+    return {**{v: f"{URL_PREFIX}{digest}-{v}.{_EXT}" for v in VARIANTS}, "full": full}
+
+
+class Catalog:
+    """The images of one catalog: variant URLs per img and source file per
+    digest, resolved once when the catalog loads, so responses only look
+    them up. A file replaced in place shows with the next catalog reload;
+    until then file_for() refuses its old URLs rather than serve new bytes."""
+
+    def __init__(self, index: SearchIndex):
+        self.index = index
+        self.variants: dict[str, dict | None] = {}
+        self.files:    dict[str, tuple[tuple[int, int], Path]] = {}  # digest -> (sig, file)
+        for doc in index.docs:
+            img = doc.food.get("img")
+            if img in self.variants:
+                continue
+            src = source(img)
+            self.variants[img] = _urls(*src) if src else None
+            if src:
+                self.files[src[0]] = (_known[img][0], src[1])
+
+
+_catalog: Catalog | None = None
+_catalog_lock = threading.Lock()
+
+
+def catalog() -> Catalog:
+    """Images of the current catalog; a new one starts rendering its missing
+    variants in the background."""
+    global _catalog
+    index = get_index()
+    c = _catalog
+    if c is None or c.index is not index:
+        with _catalog_lock:
+            c = _catalog
+            if c is None or c.index is not index:
+                c = _catalog = Catalog(index)
+                if Image is not None and c.files:
+                    threading.Thread(target=_prerender, args=(c,), name="img-prerender",
+                                     daemon=True).start()
+    return c
+
+
+def variants(img: str | None) -> dict | None:
+    """{"thumb", "medium", "full"} URLs for a local image, None otherwise."""
+    c = catalog()
+    if img in c.variants:
+        return c.variants[img]
+    src = source(img)  # not a catalog image
+    return _urls(*src) if src else None
+
+
+# ── Rendering ──────────────────────────────────────────────────────
+def _render(src: str, dst: str, size: int):
+    """Top level so the build pool can pickle it."""
+    with Image.open(src) as im:
+        im = ImageOps.exif_transpose(im)
+        im.thumbnail((size, size))
+        if im.mode not in ("RGB", "RGBA") or (_EXT == "jpg" and im.mode == "RGBA"):
+            im = im.convert("RGB")
+        tmp = f"{dst}.{os.getpid()}.{threading.get_ident()}.tmp"
+        im.save(tmp, format="WEBP" if _EXT == "webp" else "JPEG", quality=80)
+    os.replace(tmp, dst)
+
+
+# One lock per variant file, so a variant is rendered once however many
+# requests (and the prerender thread) want it at the same time.
+_render_locks: dict[str, threading.Lock] = {}
+
+
+def _rendered(path: Path, digest: str, variant: str) -> Path | None:
+    name = f"{digest}-{variant}.{_EXT}"
+    dst  = IMAGE_CACHE_DIR / name
+    if dst.exists():
+        return dst
+    with _lock:
+        lock = _render_locks.setdefault(name, threading.Lock())
+    with lock:
+        if not dst.exists():
+            IMAGE_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+            try:
+                _render(str(path), str(dst), VARIANTS[variant])
+            except OSError:
+                return None  # unreadable or vanished source
+    return dst
+
+
+def _prerender(c: Catalog):
+    for digest, (_, path) in c.files.items():
+        for variant in VARIANTS:
+            if _catalog is not c:
+                return  # superseded by a newer catalog
+            _rendered(path, digest, variant)
+
+
+def file_for(name: str) -> Path | None:
+    """The file behind a variant URL's last segment. Variants are normally
+    rendered already (by the prerender thread or `images.py build`); one
+    that is not yet is rendered here."""
+    m = _NAME.fullmatch(name)
+    if m is None:
+        return None
+    digest, variant, ext = m.groups()
+    hit = catalog().files.get(digest)
+    if hit is None:
+        return None
+    sig, path = hit
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    if (st.st_mtime_ns, st.st_size) != sig:
+        return None  # the file changed since this URL was handed out
+    if variant == "full":
+        return path if ext == path.suffix.lower() else None
+    if Image is None or variant not in VARIANTS or ext != f".{_EXT}":
+        return None
+    return _rendered(path, digest, variant)
+
+
+def build(workers: int | None = None) -> int:
+    """Render every missing variant of every static image; returns how many."""
+    if Image is None:
+        raise RuntimeError("images.build() requires Pillow")
+    IMAGE_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    jobs = []
+    for path in sorted(STATIC_DIR.rglob("*")):
+        src = source("/static/" + path.relative_to(STATIC_DIR).as_posix())
+        if src is None:
+            continue
+        for variant, size in VARIANTS.items():
+            dst = IMAGE_CACHE_DIR / f"{src[0]}-{variant}.{_EXT}"
+            if not dst.exists():
+                jobs.append((str(src[1]), str(dst), size))
+    if jobs:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(_render, *zip(*jobs)))
+    return len(jobs)
+
+
+if __name__ == "__main__":
+    # python images.py build [workers]
+    if sys.argv[1:2] != ["build"]:
+        sys.exit("usage: python images.py build [workers]")
+    print(f"rendered {build(int(sys.argv[2]) if sys.argv[2:] else None)} variants")
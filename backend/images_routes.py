@@ -0,0 +1,16 @@
+from flask import Blueprint, send_file
+import images
+from helpers import err
+
+images_bp = Blueprint("images", __name__)
+
+
+@images_bp.route(images.URL_PREFIX + "<name>")
+def get_image(name):
+    path = images.file_for(name)
+    if path is None:
+        return err("圖片不存在", 404)
+    # The name is the content hash, so the response can never go stale.
+    resp = send_file(path, conditional=True)
+    resp.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    return resp
@@ -0,0 +1,139 @@
+from __future__ import annotations
+import heapq, threading
+from collections import deque
+from time import time
+from config import TRENDING_WINDOW, TRENDING_HALF_LIFE
+from store_backend import CounterView
+from search_index import SearchIndex, get_index
+from helpers import like_count, rating_stats
+
+
+# ── All-time ───────────────────────────────────────────────────────
+def _entry(i: int, key: str) -> tuple | None:
+    """Heap entry (-score, -likes, catalog order, key), score rounded as the
+    API shows it; None if the food has neither likes nor ratings and so is
+    not on the board."""
+    likes = like_count(key)
+    stats = rating_stats(key)
+    if likes <= 0 and stats["count"] == 0:
+        return None
+    return (-round(likes + stats["avg"] * stats["count"] * 1.5, 2), -likes, i, key)
+
+
+class Leaderboard(CounterView):
+    """Foods ranked by likes + avg*count*1.5, overall ("*") and per country.
+
+    Each scope is a heap; rank[key] is a food's live entry and any other entry
+    for it is stale and dropped when it surfaces. touch() re-scores one food
+    in O(log n) and top() pops k live entries and pushes them back. Writes
+    that reach the store without a touch() (other workers, a reload) make
+    `version` fall behind and the next board() call rebuilds (see CounterView).
+    """
+
+    def __init__(self, index: SearchIndex):
+        super().__init__(index)
+        self.rank:  dict[str, tuple] = {}
+        self.heaps: dict[str, list[tuple]] = {"*": []}
+        for i, doc in enumerate(index.docs):
+            e = _entry(i, doc.key)
+            if e is not None:
+                self.rank[doc.key] = e
+                self.heaps["*"].append(e)
+                self.heaps.setdefault(doc.code, []).append(e)
+        for heap in self.heaps.values():
+            heapq.heapify(heap)
+
+    def _rescore(self, i: int, key: str):
+        e = _entry(i, key)
+        if e is None:
+            self.rank.pop(key, None)
+        elif e != self.rank.get(key):
+            self.rank[key] = e
+            for scope in ("*", self.index.docs[i].code):
+                self._push(scope, e)
+
+    def _push(self, scope: str, e: tuple):
+        heap = self.heaps.setdefault(scope, [])
+        heapq.heappush(heap, e)
+        if len(heap) > 2 * len(self.rank) + 64:
+            live = [x for x in heap if self.rank.get(x[3]) == x]
+            heap[:] = list(dict.fromkeys(live))
+            heapq.heapify(heap)
+
+    def top(self, k: int, country: str = "") -> list[tuple[int, float]]:
+        """(doc index, score) of the best k foods, overall or in one country."""
+        heap = self.heaps.get(country or "*")
+        if not heap:
+            return []
+        with self.lock:
+            out: list[tuple] = []
+            while heap and len(out) < k:
+                e = heapq.heappop(heap)
+                if self.rank.get(e[3]) == e and (not out or out[-1] != e):
+                    out.append(e)
+            for e in out:
+                heapq.heappush(heap, e)
+        return [(e[2], -e[0]) for e in out]
+
+
+_board: Leaderboard | None = None
+_board_lock = threading.Lock()
+
+
+def board() -> Leaderboard:
+    """The leaderboard for the current catalog and counters."""
+    global _board
+    index = get_index()
+    b = _board
+    if b is None or not b.current(index):
+        with _board_lock:
+            b = _board
+            if b is None or not b.current(index):
+                b = _board = Leaderboard(index)
+    return b
+
+
+# ── Trending ───────────────────────────────────────────────────────
+class Trending:
+    """Like/rating events of the last `window` seconds in this worker, each
+    weighted by 0.5 ** (age / half_life). A like counts 1 (an unlike -1) and
+    a rating 1.5 per star it adds (a re-rating counts the difference), the
+    same weights as the all-time score."""
+
+    def __init__(self, window: int = TRENDING_WINDOW, half_life: int = TRENDING_HALF_LIFE,
+                 max_events: int = 100000):
+        self.window     = window
+        self.half_life  = half_life
+        self.max_events = max_events
+        self.events: deque[tuple[float, str, float]] = deque()
+        self.lock       = threading.Lock()
+
+    def record(self, key: str, weight: float):
+        with self.lock:
+            self.events.append((time(), key, weight))
+            while len(self.events) > self.max_events:
+                self.events.popleft()
+
+    def top(self, k: int, keep=lambda key: True) -> list[tuple[str, float]]:
+        """(key, score) of the k hottest keys passing keep(key)."""
+        now = time()
+        scores: dict[str, float] = {}
+        with self.lock:
+            while self.events and self.events[0][0] < now - self.window:
+                self.events.popleft()
+            for ts, key, w in self.events:
+                scores[key] = scores.get(key, 0.0) + w * 0.5 ** ((now - ts) / self.half_life)
+        return heapq.nlargest(k, ((key, s) for key, s in scores.items() if s > 1e-9 and keep(key)),
+                              key=lambda ks: ks[1])
+
+
+trending = Trending()
+
+
+def touch(key: str, step, weight: float):
+    """Record a like/rating write on `key`: `step` is data_store.write_step()
+    and `weight` the change in score as Trending counts it."""
+    b = _board
+    if b is not None:
+        b.touch(key, step)
+    trending.record(key, weight)
@@ -0,0 +1,56 @@
+from __future__ import annotations
+from datetime import datetime
+from sqlalchemy import Column, DateTime, MetaData, String, Table, inspect, select, text
+from models import db, Favorite, FavoriteList
+
+# Applied migration ids. Kept out of db.metadata so create_all never touches it.
+_applied = Table(
+    "schema_migrations", MetaData(),
+    Column("id", String(100), primary_key=True),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+# ── Migrations ─────────────────────────────────────────────────────
+# Each step runs once, in order, in its own transaction. Steps must also be
+# safe on a schema that already has the change: databases created before this
+# module existed have no schema_migrations rows at all.
+def _create_tables(conn):
+    db.metadata.create_all(conn)
+
+
+def _favorites_list_id(conn):
+    if "list_id" not in {c["name"] for c in inspect(conn).get_columns("favorites")}:
+        conn.execute(text(
+            "ALTER TABLE favorites ADD COLUMN "
+            "list_id INTEGER REFERENCES favorite_lists(id) ON DELETE SET NULL"
+        ))
+
+
+def _favorites_indexes(conn):
+    for table, name in ((Favorite.__table__, "ix_favorites_list_user"),
+                        (FavoriteList.__table__, "ix_favorite_lists_user")):
+        next(i for i in table.indexes if i.name == name).create(conn, checkfirst=True)
+
+
+MIGRATIONS = [
+    ("0001_create_tables",     _create_tables),
+    ("0002_favorites_list_id", _favorites_list_id),
+    ("0003_favorites_indexes", _favorites_indexes),
+]
+
+
+def migrate(engine) -> list[str]:
+    """Apply pending migrations; returns the ids applied."""
+    _applied.create(engine, checkfirst=True)
+    with engine.connect() as conn:
+        done = set(conn.execute(select(_applied.c.id)).scalars())
+    ran = []
+    for mid, step in MIGRATIONS:
+        if mid in done:
+            continue
+        with engine.begin() as conn:
+            step(conn)
+            conn.execute(_applied.insert().values(id=mid, applied_at=datetime.utcnow()))
+        ran.append(mid)
+    return ran
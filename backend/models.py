@@ -1,8 +1,24 @@
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
+from config import (
+    DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE,
+    DB_POOL_PRE_PING, DB_STATEMENT_TIMEOUT_MS,
+)
 
 db = SQLAlchemy()
 
+
+def engine_options(url: str) -> dict:
+    """SQLALCHEMY_ENGINE_OPTIONS from the DB_* settings."""
+    opts = {"pool_pre_ping": DB_POOL_PRE_PING, "pool_recycle": DB_POOL_RECYCLE}
+    if url.startswith("sqlite"):
+        return opts  # SQLite pools are per-file; sizing does not apply
+    opts.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT)
+    if DB_STATEMENT_TIMEOUT_MS and url.startswith("postgresql"):
+        opts["connect_args"] = {"options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"}
+    return opts
+
+
 class User(db.Model):
     __tablename__ = "users"
     id            = db.Column(db.Integer, primary_key=True)
@@ -21,6 +37,7 @@ class FavoriteList(db.Model):
     user_id    = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
     name       = db.Column(db.String(100), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    __table_args__ = (db.Index("ix_favorite_lists_user", "user_id", "id"),)
 
 
 class Favorite(db.Model):
@@ -31,7 +48,12 @@ class Favorite(db.Model):
     food_name    = db.Column(db.String(200), nullable=False)
     list_id      = db.Column(db.Integer, db.ForeignKey("favorite_lists.id"), nullable=True)
     created_at   = db.Column(db.DateTime, default=datetime.utcnow)
-    __table_args__ = (db.UniqueConstraint("user_id", "country_code", "food_name"),)
+    # The unique constraint leads with user_id and serves per-user lookups;
+    # (list_id, user_id) serves list membership and ON DELETE SET NULL.
+    __table_args__ = (
+        db.UniqueConstraint("user_id", "country_code", "food_name"),
+        db.Index("ix_favorites_list_user", "list_id", "user_id"),
+    )
 
     def to_dict(self):
         return {
@@ -40,3 +62,96 @@ class Favorite(db.Model):
             "food_name":    self.food_name,
             "list_id":      self.list_id,
         }
+
+
+# ── Likes / Ratings / Comments (STORE_BACKEND=sql) ─────────────────
+class FoodStat(db.Model):
+    """Running totals per food, updated with in-place increments."""
+    __tablename__ = "food_stats"
+    country_code    = db.Column(db.String(10), primary_key=True)
+    food_name       = db.Column(db.String(200), primary_key=True)
+    likes           = db.Column(db.Integer, nullable=False, default=0)
+    rating_sum      = db.Column(db.Integer, nullable=False, default=0)
+    rating_count    = db.Column(db.Integer, nullable=False, default=0)
+    counter_version = db.Column(db.Integer, nullable=False, default=0)
+    comment_version = db.Column(db.Integer, nullable=False, default=0)
+
+
+class FoodLike(db.Model):
+    __tablename__ = "food_likes"
+    country_code = db.Column(db.String(10), primary_key=True)
+    food_name    = db.Column(db.String(200), primary_key=True)
+    liker        = db.Column(db.String(100), primary_key=True)
+
+
+class FoodRating(db.Model):
+    __tablename__ = "food_ratings"
+    country_code = db.Column(db.String(10), primary_key=True)
+    food_name    = db.Column(db.String(200), primary_key=True)
+    rater        = db.Column(db.String(100), primary_key=True)
+    stars        = db.Column(db.SmallInteger, nullable=False)
+
+
+class Comment(db.Model):
+    __tablename__ = "comments"
+    id           = db.Column(db.BigInteger, primary_key=True, autoincrement=False)
+    country_code = db.Column(db.String(10), nullable=False)
+    food_name    = db.Column(db.String(200), nullable=False)
+    parent_id    = db.Column(db.BigInteger, nullable=True)
+    user_id      = db.Column(db.Integer, nullable=True)
+    author       = db.Column(db.String(100), nullable=False)
+    text         = db.Column(db.String(300), nullable=False)
+    ts           = db.Column(db.Integer, nullable=False)
+    likes        = db.Column(db.Integer, nullable=False, default=0)
+    delete_token = db.Column(db.String(64), nullable=True)
+    __table_args__ = (
+        db.Index("ix_comments_food", "country_code", "food_name"),
+        db.Index("ix_comments_user", "user_id"),
+    )
+
+    def to_dict(self):
+        d = {
+            "id":      self.id,
+            "user":    self.author,
+            "text":    self.text,
+            "ts":      self.ts,
+            "likes":   self.likes,
+            "user_id": self.user_id,
+        }
+        if self.parent_id is not None:
+            d["parent_id"] = self.parent_id
+        if self.delete_token:
+            d["delete_token"] = self.delete_token
+        return d
+
+
+def insert_ignore(model, rows: list[dict], keys: tuple[str, ...] = ()):
+    """INSERT rows, skipping ones that hit a unique constraint, in one statement
+    where the dialect has ON CONFLICT DO NOTHING. Returns the rows inserted:
+    how many, or with `keys` the tuple of those fields of each one."""
+    if not rows:
+        return [] if keys else 0
+    dialect = db.session.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        from sqlalchemy.exc import IntegrityError
+        added = []
+        for row in rows:
+            try:
+                with db.session.begin_nested():
+                    db.session.execute(db.insert(model).values(**row))
+                added.append(tuple(row[k] for k in keys))
+            except IntegrityError:
+                pass
+        return added if keys else len(added)
+    added, count = [], 0
+    for i in range(0, len(rows), 500):  # stay under bound-parameter limits
+        stmt = insert(model).values(rows[i:i + 500]).on_conflict_do_nothing()
+        if keys:
+            added += db.session.execute(stmt.returning(*(getattr(model, k) for k in keys))).all()
+        else:
+            count += db.session.execute(stmt).rowcount
+    return [tuple(r) for r in added] if keys else count
@@ -0,0 +1,167 @@
+from __future__ import annotations
+import sqlite3, threading
+from collections import OrderedDict
+from time import time
+from config import RATE_LIMIT_BACKEND, RATE_LIMIT_SHARDS, RATE_LIMIT_MAX_KEYS, RATE_LIMIT_DB
+
+# action -> (seconds per token, burst). Burst 1 allows one hit per interval.
+LIMITS: dict[str, tuple[float, int]] = {
+    "like":         (2,  1),
+    "comment_anon": (30, 1),
+    "comment_auth": (5,  1),
+    "comment_like": (2,  1),
+}
+_DEFAULT_LIMIT = (2, 1)
+
+
+# ── Token Bucket ───────────────────────────────────────────────────
+# A bucket is (tokens, ts, full_at): tokens left at time ts, and when it will
+# have refilled completely. A full bucket is indistinguishable from a missing
+# one, so any entry past full_at can be dropped.
+def _take(state, now: float, action: str):
+    """(allowed, retry_after, new_state) for one hit."""
+    interval, burst = LIMITS.get(action, _DEFAULT_LIMIT)
+    if state is None:
+        tokens = float(burst)
+    else:
+        tokens = min(burst, state[0] + (now - state[1]) / interval)
+    if tokens < 1:
+        return False, int((1 - tokens) * interval) + 1, (tokens, now, now + (burst - tokens) * interval)
+    tokens -= 1
+    return True, 0, (tokens, now, now + (burst - tokens) * interval)
+
+
+class _Counters:
+    def __init__(self):
+        self.lock     = threading.Lock()
+        self.allowed:  dict[str, int] = {}
+        self.rejected: dict[str, int] = {}
+
+    def add(self, action: str, ok: bool):
+        with self.lock:
+            d = self.allowed if ok else self.rejected
+            d[action] = d.get(action, 0) + 1
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {a: {"allowed": self.allowed.get(a, 0), "rejected": self.rejected.get(a, 0)}
+                    for a in sorted(self.allowed.keys() | self.rejected.keys())}
+
+
+# ── In-Process ─────────────────────────────────────────────────────
+class _Shard:
+    __slots__ = ("lock", "buckets", "evicted")
+
+    def __init__(self):
+        self.lock    = threading.Lock()
+        self.buckets: OrderedDict[str, tuple[float, float, float]] = OrderedDict()
+        self.evicted = 0
+
+
+class MemoryLimiter:
+    """Buckets in lock-striped LRU maps.
+
+    Each hit drops refilled buckets from the cold end of its shard, and the
+    least recently used ones once the shard is over its share of max_keys.
+    Forgetting a bucket early only ever makes the limit more lenient.
+    """
+
+    def __init__(self, shards: int = RATE_LIMIT_SHARDS, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.shards    = [_Shard() for _ in range(max(1, shards))]
+        self.shard_max = max(1, max_keys // len(self.shards))
+        self.counters  = _Counters()
+
+    def hit(self, key: str, action: str) -> tuple[bool, int]:
+        sh  = self.shards[hash(key) % len(self.shards)]
+        now = time()
+        with sh.lock:
+            b = sh.buckets
+            ok, retry, b[key] = _take(b.get(key), now, action)
+            b.move_to_end(key)
+            while len(b) > 1:
+                oldest = next(iter(b.values()))
+                if oldest[2] > now and len(b) <= self.shard_max:
+                    break
+                b.popitem(last=False)
+                sh.evicted += 1
+        self.counters.add(action, ok)
+        return ok, retry
+
+    def metrics(self) -> dict:
+        return {
+            "backend": "memory",
+            "keys":    sum(len(sh.buckets) for sh in self.shards),
+            "evicted": sum(sh.evicted for sh in self.shards),
+            "actions": self.counters.snapshot(),
+        }
+
+
+# ── Shared (SQLite) ────────────────────────────────────────────────
+class SqliteLimiter:
+    """Buckets in one SQLite file shared by every worker on the machine.
+
+    Each hit is a single BEGIN IMMEDIATE transaction, so concurrent workers
+    serialize on the bucket. Refilled rows are deleted every PRUNE_EVERY hits
+    of this process. Counters are per process.
+    """
+    PRUNE_EVERY = 1000
+
+    def __init__(self, path=RATE_LIMIT_DB):
+        self.path     = path
+        self.local    = threading.local()
+        self.counters = _Counters()
+        self.hits     = 0
+        self.evicted  = 0
+        self.lock     = threading.Lock()  # hits and evicted
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS buckets "
+                         "(k TEXT PRIMARY KEY, tokens REAL, ts REAL, full_at REAL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_buckets_full_at ON buckets (full_at)")
+            self.local.conn = conn
+        return conn
+
+    def hit(self, key: str, action: str) -> tuple[bool, int]:
+        conn = self._conn()
+        now  = time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            state = conn.execute("SELECT tokens, ts, full_at FROM buckets WHERE k = ?", (key,)).fetchone()
+            ok, retry, state = _take(state, now, action)
+            conn.execute("INSERT OR REPLACE INTO buckets VALUES (?, ?, ?, ?)", (key, *state))
+            with self.lock:
+                self.hits += 1
+                prune = self.hits % self.PRUNE_EVERY == 0
+            if prune:
+                pruned = conn.execute("DELETE FROM buckets WHERE full_at <= ?", (now,)).rowcount
+                with self.lock:
+                    self.evicted += pruned
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        self.counters.add(action, ok)
+        return ok, retry
+
+    def metrics(self) -> dict:
+        return {
+            "backend": "sqlite",
+            "keys":    self._conn().execute("SELECT COUNT(*) FROM buckets").fetchone()[0],
+            "evicted": self.evicted,
+            "actions": self.counters.snapshot(),
+        }
+
+
+def _make_limiter():
+    if RATE_LIMIT_BACKEND == "sqlite":
+        return SqliteLimiter()
+    return MemoryLimiter()
+
+
+limiter = _make_limiter()
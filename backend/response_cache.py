@@ -0,0 +1,56 @@
+from __future__ import annotations
+import hashlib, threading
+from collections import OrderedDict
+from functools import wraps
+from flask import current_app, request
+from config import RESPONSE_CACHE_SIZE
+from store import foods_snapshot
+
+# (endpoint, view args, query args) -> (version, etag, body, mimetype)
+_cache: OrderedDict[tuple, tuple] = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def catalog_version() -> int:
+    return foods_snapshot()[1]
+
+
+def cached(version_fn):
+    """Serve a read-only JSON view from encoded bytes while version_fn() is unchanged.
+
+    version_fn receives the view's URL arguments and must return a value that
+    changes whenever the response could. Responses carry a content-hash ETag,
+    so a matching If-None-Match is answered with 304 and no body.
+    """
+    def deco(view):
+        @wraps(view)
+        def wrapper(**kwargs):
+            version = version_fn(**kwargs)
+            ckey = (request.endpoint, tuple(sorted(kwargs.items())),
+                    tuple(sorted(request.args.items(multi=True))))
+            with _cache_lock:
+                hit = _cache.get(ckey)
+                if hit is not None:
+                    _cache.move_to_end(ckey)
+            if hit is None or hit[0] != version:
+                resp = current_app.make_response(view(**kwargs))
+                if resp.status_code != 200:
+                    return resp
+                body = resp.get_data()
+                hit  = (version, hashlib.sha1(body).hexdigest(), body, resp.mimetype)
+                with _cache_lock:
+                    _cache[ckey] = hit
+                    while len(_cache) > RESPONSE_CACHE_SIZE:
+                        _cache.popitem(last=False)
+            _, etag, body, mimetype = hit
+            resp = current_app.response_class(body, mimetype=mimetype)
+            resp.set_etag(etag)
+            resp.headers["Cache-Control"] = "no-cache"
+            return resp.make_conditional(request)
+        return wrapper
+    return deco
+
+
+def clear():
+    with _cache_lock:
+        _cache.clear()
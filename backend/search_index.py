@@ -0,0 +1,171 @@
+from __future__ import annotations
+import heapq, threading
+from store import foods_snapshot
+from config import COUNTRY_MAP
+from helpers import kstr
+
+
+# ── Tokenizer ──────────────────────────────────────────────────────
+# Character uni- and bigrams work the same for 「壽司」 and "sushi": every
+# substring of length >= 2 contains at least one indexed bigram, so the
+# posting lists give a superset of the substring matches, which is then
+# confirmed against the pre-lowercased text.
+def grams(text: str) -> set[str]:
+    out = set(text)
+    out.update(text[i:i + 2] for i in range(len(text) - 1))
+    return out
+
+
+def query_grams(q: str) -> set[str]:
+    if len(q) == 1:
+        return {q}
+    return {q[i:i + 2] for i in range(len(q) - 1)}
+
+
+class Doc:
+    __slots__ = ("code", "country_name", "food", "key", "name_l", "desc_l", "tags_l")
+
+    def __init__(self, code: str, country_name: str, food: dict):
+        self.code         = code
+        self.country_name = country_name
+        self.food         = food
+        self.key          = kstr(code, food.get("name", ""))
+        self.name_l       = food.get("name", "").lower()
+        self.desc_l       = food.get("desc", "").lower()
+        self.tags_l       = [t.lower() for t in food.get("tags", [])]
+
+
+class SearchIndex:
+    def __init__(self, data: dict):
+        self.docs: list[Doc] = []
+        self.grams:     dict[str, list[int]] = {}
+        self.tags:      dict[str, list[int]] = {}
+        self.countries: dict[str, list[int]] = {}
+        self.by_key:    dict[str, int] = {}
+        # Tags as bit positions; tag_bits[i] is doc i's tag set as an int mask.
+        self.tag_ids:   dict[str, int] = {}
+        self.tag_bits:  list[int] = []
+        self._related:  dict[int, list[tuple[int, list[int]]]] = {}
+        for code, country_name in COUNTRY_MAP.items():
+            block = data.get(country_name) or data.get(code)
+            if not block:
+                continue
+            for f in block.get("foods", []):
+                self._add(Doc(code, country_name, f))
+
+    def _add(self, doc: Doc):
+        i = len(self.docs)
+        self.docs.append(doc)
+        self.by_key[doc.key] = i
+        self.countries.setdefault(doc.code, []).append(i)
+        bits = 0
+        for t in set(doc.food.get("tags", [])):
+            self.tags.setdefault(t, []).append(i)
+            bits |= 1 << self.tag_ids.setdefault(t, len(self.tag_ids))
+        self.tag_bits.append(bits)
+        toks = grams(doc.name_l) | grams(doc.desc_l)
+        for t in doc.tags_l:
+            toks |= grams(t)
+        for g in toks:
+            self.grams.setdefault(g, []).append(i)
+
+    def search(self, q: str = "", country: str = "", tag: str = "") -> list[tuple[Doc, float]]:
+        return [(self.docs[i], score) for i, score in self.matches(q, country, tag)]
+
+    def matches(self, q: str = "", country: str = "", tag: str = "") -> list[tuple[int, float]]:
+        """Ids of the docs matching all given criteria in catalog order, with a relevance score.
+
+        `q` must already be lower-cased; it matches as a substring of the name,
+        description or any tag, exactly like the original linear scan.
+        """
+        postings = []
+        if country:
+            postings.append(self.countries.get(country, []))
+        if tag:
+            postings.append(self.tags.get(tag, []))
+        if q:
+            postings.extend(self.grams.get(g, []) for g in query_grams(q))
+        if postings:
+            postings.sort(key=len)
+            ids = set(postings[0])
+            for p in postings[1:]:
+                if not ids:
+                    break
+                ids.intersection_update(p)
+            ids = sorted(ids)
+        else:
+            ids = range(len(self.docs))
+
+        out = []
+        for i in ids:
+            score = _score(self.docs[i], q) if q else 0.0
+            if score or not q:
+                out.append((i, score))
+        return out
+
+    # ── Related ──
+    def related_groups(self, i: int) -> list[tuple[int, list[int]]]:
+        """Docs sharing at least one tag with doc i as (shared tag count, doc
+        ids in catalog order), most shared first. Computed once per doc for
+        the life of this index, from the tag posting lists only."""
+        groups = self._related.get(i)
+        if groups is None:
+            bits  = self.tag_bits[i]
+            cands = set()
+            for t in set(self.docs[i].food.get("tags", [])):
+                cands.update(self.tags[t])
+            cands.discard(i)
+            by_common: dict[int, list[int]] = {}
+            for j in sorted(cands):
+                by_common.setdefault(bin(bits & self.tag_bits[j]).count("1"), []).append(j)
+            groups = self._related[i] = sorted(by_common.items(), reverse=True)
+        return groups
+
+    def related(self, key: str, k: int, likes) -> list[tuple[Doc, int]]:
+        """Top k (doc, shared tags) for the food `key`: most shared tags first,
+        then most likes (likes(doc) -> int), then catalog order. A food without
+        tags (or unknown) relates to every other food by likes alone."""
+        i = self.by_key.get(key)
+
+        def rank(j: int) -> tuple[int, int]:
+            return -likes(self.docs[j]), j
+
+        if i is None or not self.tag_bits[i]:
+            top = heapq.nsmallest(k, (j for j in range(len(self.docs)) if j != i), key=rank)
+            return [(self.docs[j], 0) for j in top]
+        out: list[tuple[Doc, int]] = []
+        for common, group in self.related_groups(i):
+            out += [(self.docs[j], common) for j in heapq.nsmallest(k - len(out), group, key=rank)]
+            if len(out) >= k:
+                break
+        return out
+
+
+def _score(doc: Doc, q: str) -> float:
+    score = 0.0
+    if q in doc.name_l:
+        score += 4.0 if doc.name_l == q else 3.0 if doc.name_l.startswith(q) else 2.0
+    if any(q == t for t in doc.tags_l):
+        score += 1.5
+    elif any(q in t for t in doc.tags_l):
+        score += 1.0
+    if q in doc.desc_l:
+        score += 0.5
+    return score
+
+
+_index: SearchIndex | None = None
+_index_version = -1
+_index_lock = threading.Lock()
+
+
+def get_index() -> SearchIndex:
+    """The index for the current catalog; rebuilt after add_food or /api/_reload."""
+    global _index, _index_version
+    data, version = foods_snapshot()
+    if _index is None or _index_version != version:
+        with _index_lock:
+            if _index is None or _index_version != version:
+                _index = SearchIndex(data)
+                _index_version = version
+    return _index
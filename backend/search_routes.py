@@ -1,7 +1,12 @@
+from time import time
 from flask import Blueprint, request, jsonify
+import catalog_columns, images, leaderboard
 from store import load_foods_json
+from store_backend import data_store
 from config import COUNTRY_MAP
-from helpers import kstr, like_count, rating_stats
+from helpers import like_count, rating_stats, err, Page, MAX_PAGE
+from search_index import get_index
+from response_cache import cached, catalog_version
 
 search_bp = Blueprint("search", __name__)
 
@@ -16,55 +21,58 @@ def search():
     except ValueError:
         min_rating = 0.0
     sort_by = request.args.get("sort", "likes")
+    try:
+        page = Page.from_request()
+    except ValueError:
+        return err("cursor 無效")
 
-    data    = load_foods_json()
-    results = []
+    sort_key = _SEARCH_SORTS.get(sort_by, _SEARCH_SORTS["likes"])
+    cols     = catalog_columns.columns()
+    if cols is not None and sort_by in catalog_columns.SEARCH_SORTS:
+        # Relevance scores are not needed for these orders: filter and sort as columns.
+        docs = cols.index.docs
+        ids  = [i for i, _ in cols.index.matches(q)] if q else None
+        rows = cols.select(ids, filter_country, filter_tag, min_rating)
 
-    for code, country_name in COUNTRY_MAP.items():
-        if filter_country and filter_country != code:
-            continue
-        block = data.get(country_name) or data.get(code)
-        if not block:
-            continue
-        for f in block.get("foods", []):
-            fname = f.get("name", "")
-            fdesc = f.get("desc", "")
-            ftags = f.get("tags", [])
-            if filter_tag and filter_tag not in ftags:
-                continue
-            if q and not any([
-                q in fname.lower(),
-                q in fdesc.lower(),
-                any(q in t.lower() for t in ftags),
-            ]):
-                continue
-            key   = kstr(code, fname)
-            likes = like_count(key)
-            stats = rating_stats(key)
+        def row(i: int) -> tuple:
+            return docs[i], 0.0, like_count(docs[i].key), rating_stats(docs[i].key)
+
+        ids, meta = cols.page(rows, catalog_columns.SEARCH_SORTS[sort_by], page, lambda i: sort_key(row(i)))
+        rows = [row(i) for i in ids]
+    else:
+        results = []
+        for doc, score in get_index().search(q, filter_country, filter_tag):
+            likes = like_count(doc.key)
+            stats = rating_stats(doc.key)
             if min_rating > 0 and stats["avg"] < min_rating:
                 continue
-            results.append({
-                "code":         code,
-                "countryName":  country_name,
-                "name":         fname,
-                "img":          f.get("img"),
-                "tags":         ftags,
-                "likes":        likes,
-                "avg_rating":   stats["avg"],
-                "rating_count": stats["count"],
-            })
-
-    if sort_by == "rating":
-        results.sort(key=lambda x: (-x["avg_rating"], -x["likes"]))
-    elif sort_by == "name":
-        results.sort(key=lambda x: x["name"])
-    else:
-        results.sort(key=lambda x: (-x["likes"], -x["avg_rating"]))
+            results.append((doc, score, likes, stats))
+        rows, meta = page.apply(results, sort_key)
+    return jsonify({"results": [{
+        "code":         doc.code,
+        "countryName":  doc.country_name,
+        "name":         doc.food.get("name", ""),
+        "img":          doc.food.get("img"),
+        "img_variants": images.variants(doc.food.get("img")),
+        "tags":         doc.food.get("tags", []),
+        "likes":        likes,
+        "avg_rating":   stats["avg"],
+        "rating_count": stats["count"],
+    } for doc, score, likes, stats in rows], **meta})
 
-    return jsonify({"results": results})
+
+# Rows are (doc, score, likes, stats); every key ends in (code, name) so the
+# order is total and usable as a pagination cursor.
+_SEARCH_SORTS = {
+    "likes":     lambda r: (-r[2], -r[3]["avg"], r[0].code, r[0].food.get("name", "")),
+    "rating":    lambda r: (-r[3]["avg"], -r[2], r[0].code, r[0].food.get("name", "")),
+    "name":      lambda r: (r[0].food.get("name", ""), r[0].code),
+    "relevance": lambda r: (-r[1], -r[2], r[0].code, r[0].food.get("name", "")),
+}
 
 
 @search_bp.route("/api/tags")
+@cached(lambda: catalog_version())
 def get_tags():
     data = load_foods_json()
     tags: set = set()
@@ -75,37 +83,45 @@ def get_tags():
     return jsonify({"tags": sorted(tags)})
 
 
+def _top_version():
+    version = (catalog_version(), data_store.counter_version())
+    if request.args.get("trending"):
+        return version + (int(time() // 60),)  # decay moves scores without writes
+    return version
+
+
 @search_bp.route("/api/top-foods")
+@cached(_top_version)
 def get_top_foods():
-    data  = load_foods_json()
-    items = []
-    for code, country_name in COUNTRY_MAP.items():
-        block = data.get(country_name) or data.get(code)
-        if not block:
-            continue
-        for f in block.get("foods", []):
-            fname = f.get("name")
-            if not fname:
-                continue
-            key   = kstr(code, fname)
-            likes = like_count(key)
-            stats = rating_stats(key)
-            score = likes + (stats["avg"] * stats["count"] * 1.5)
-            if likes <= 0 and stats["count"] == 0:
-                continue
-            items.append({
-                "code":         code,
-                "countryName":  country_name,
-                "name":         fname,
-                "img":          f.get("img"),
-                "likes":        likes,
-                "avg_rating":   stats["avg"],
-                "rating_count": stats["count"],
-                "score":        round(score, 2),
-            })
-    items.sort(key=lambda x: (-x["score"], -x["likes"]))
     try:
-        limit = max(1, int(request.args.get("limit", 5)))
+        limit = min(max(1, int(request.args.get("limit", 5))), MAX_PAGE)
     except ValueError:
         limit = 5
-    return jsonify({"foods": items[:limit]})
+    country = (request.args.get("country") or "").upper().strip()
+    index   = get_index()
+    if request.args.get("trending"):
+        docs = index.docs
+
+        def keep(key: str) -> bool:
+            return key in index.by_key and (not country or docs[index.by_key[key]].code == country)
+
+        top = [(index.by_key[key], score) for key, score in leaderboard.trending.top(limit, keep)]
+    else:
+        top = leaderboard.board().top(limit, country)
+
+    items = []
+    for i, score in top:
+        doc   = index.docs[i]
+        stats = rating_stats(doc.key)
+        items.append({
+            "code":         doc.code,
+            "countryName":  doc.country_name,
+            "name":         doc.food.get("name"),
+            "img":          doc.food.get("img"),
+            "img_variants": images.variants(doc.food.get("img")),
+            "likes":        like_count(doc.key),
+            "avg_rating":   stats["avg"],
+            "rating_count": stats["count"],
+            "score":        round(score, 2),
+        })
+    return jsonify({"foods": items})
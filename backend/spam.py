@@ -0,0 +1,288 @@
+from __future__ import annotations
+import re, threading
+from abc import ABC, abstractmethod
+from collections import deque
+from time import time
+from config import SPAM_BLOCKLIST, SPAM_FLOOD_COUNT, SPAM_FLOOD_WINDOW
+
+_REPEAT      = re.compile(r"(.)\1{6,}")  # "." skips newlines, as is_spam() always did
+_ASCII_ALPHA = re.compile(r"[A-Za-z]")
+_ASCII_UPPER = re.compile(r"[A-Z]")
+
+
+# ── Scan ───────────────────────────────────────────────────────────
+class Features:
+    """Everything the rules look at, gathered by Pipeline.scan()."""
+    __slots__ = ("length", "repeat", "ascii_alpha", "ascii_upper", "hits", "norm")
+
+    def __init__(self):
+        self.length      = 0
+        self.repeat      = False        # the same character 7+ times in a row
+        self.ascii_alpha = 0
+        self.ascii_upper = 0
+        self.hits: dict[str, int] = {}  # pattern kind -> occurrences
+        self.norm        = ""           # lower-cased letters and digits only
+
+
+class _Automaton:
+    """Aho-Corasick over all rule patterns (matched lower-case): one step per
+    character no matter how many patterns there are."""
+
+    def __init__(self, patterns: dict[str, str]):
+        self.goto: list[dict[str, int]] = [{}]
+        self.fail: list[int] = [0]
+        self.out:  list[tuple[str, ...]] = [()]
+        for word, kind in patterns.items():
+            s = 0
+            for ch in word.lower():
+                nxt = self.goto[s].get(ch)
+                if nxt is None:
+                    nxt = self.goto[s][ch] = len(self.goto)
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append(())
+                s = nxt
+            self.out[s] += (kind,)
+        queue = deque(self.goto[0].values())
+        while queue:
+            s = queue.popleft()
+            for ch, nxt in self.goto[s].items():
+                queue.append(nxt)
+                f = self.fail[s]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(ch, 0)
+                self.out[nxt] += self.out[self.fail[nxt]]
+        # First position where any pattern could start; the scan begins there.
+        self.start = re.compile("[" + "".join(map(re.escape, self.goto[0])) + "]")
+
+
+# ── Rules ──────────────────────────────────────────────────────────
+# A rule may declare literal patterns (pattern -> kind); the pipeline matches
+# all of them in the shared scan and the rule reads f.hits[kind].
+class Rule(ABC):
+    name     = "rule"
+    weight   = 1.0
+    patterns: dict[str, str] = {}
+
+    @abstractmethod
+    def score(self, f: Features, text: str) -> float:
+        """`weight` if the rule fires on this text, else 0."""
+
+
+class RepeatRule(Rule):
+    """The same character 7+ times in a row (the old (.)\\1{6,})."""
+    name = "repeat"
+
+    def score(self, f, text):
+        return self.weight if f.repeat else 0.0
+
+
+class ShoutRule(Rule):
+    """Mostly upper-case Latin text."""
+    name = "shout"
+
+    def score(self, f, text):
+        if f.ascii_alpha > 8 and f.ascii_upper / f.ascii_alpha > 0.7:
+            return self.weight
+        return 0.0
+
+
+class BlocklistRule(Rule):
+    name = "blocklist"
+
+    def __init__(self, words):
+        self.patterns = {w: "block" for w in words if w}
+
+    def score(self, f, text):
+        return self.weight if f.hits.get("block") else 0.0
+
+
+class LinkRule(Rule):
+    """More than one link, at over one link per 100 characters. A URL counts
+    once: the "www." of "http://www." is not a second link."""
+    name     = "links"
+    patterns = {"http://": "link", "https://": "link", "www.": "www", "://www.": "url_www"}
+
+    def score(self, f, text):
+        h = f.hits
+        links = h.get("link", 0) + h.get("www", 0) - h.get("url_www", 0)
+        return self.weight if links > 1 and links * 100 > f.length else 0.0
+
+
+class FloodRule(Rule):
+    """Near-duplicates of recently accepted comments (see FloodIndex)."""
+    name = "flood"
+
+    def __init__(self, index: FloodIndex, count: int = SPAM_FLOOD_COUNT):
+        self.index = index
+        self.count = count
+
+    def score(self, f, text):
+        return self.weight if self.index.similar(f.norm) >= self.count else 0.0
+
+
+# ── Flood Index ────────────────────────────────────────────────────
+# One-permutation MinHash over character 3-grams of the normalized text: each
+# 3-gram hash falls in one of 12 bins by value and every bin keeps its
+# minimum, so one pass gives all 12 minima. Bins form 4 bands of 3; two
+# comments collide in some band with probability about 1-(1-J^3)^4 for
+# Jaccard similarity J (≈0.94 at J=0.8, ≈0.10 at J=0.3). Bands with an empty
+# bin are skipped, or unrelated short texts would collide on them. hash() is
+# salted per process, which is fine for an in-process index.
+_BINS, _BANDS = 12, 4
+
+
+def _bands(norm: str) -> list[tuple]:
+    mins = [None] * _BINS
+    for i in range(len(norm) - 2):
+        h = hash(norm[i:i + 3])
+        b = h % _BINS
+        if mins[b] is None or h < mins[b]:
+            mins[b] = h
+    w = _BINS // _BANDS
+    bands = [(b, *mins[b * w:(b + 1) * w]) for b in range(_BANDS)]
+    return [k for k in bands if None not in k]
+
+
+class FloodIndex:
+    """Band keys of comments accepted in the last `window` seconds.
+
+    Texts shorter than `min_len` normalized characters are ignored: short
+    comments like "好吃" are legitimately repeated by many people.
+    """
+
+    def __init__(self, window: int = SPAM_FLOOD_WINDOW, min_len: int = 12, max_entries: int = 50000):
+        self.window      = window
+        self.min_len     = min_len
+        self.max_entries = max_entries
+        self.recent: deque[tuple[float, int, list[tuple]]] = deque()
+        self.bands:  dict[tuple, set[int]] = {}
+        self.seq     = 0
+        self.lock    = threading.Lock()
+
+    def _expire(self, now: float):
+        while self.recent and (self.recent[0][0] < now - self.window
+                               or len(self.recent) > self.max_entries):
+            _, eid, keys = self.recent.popleft()
+            for k in keys:
+                ids = self.bands.get(k)
+                if ids is not None:
+                    ids.discard(eid)
+                    if not ids:
+                        del self.bands[k]
+
+    def similar(self, norm: str) -> int:
+        """Recent entries sharing a band with `norm`."""
+        if len(norm) < self.min_len:
+            return 0
+        keys = _bands(norm)
+        with self.lock:
+            self._expire(time())
+            found: set[int] = set()
+            for k in keys:
+                found |= self.bands.get(k, set())
+        return len(found)
+
+    def add(self, norm: str):
+        if len(norm) < self.min_len:
+            return
+        keys = _bands(norm)
+        now  = time()
+        with self.lock:
+            self.seq += 1
+            self.recent.append((now, self.seq, keys))
+            for k in keys:
+                self.bands.setdefault(k, set()).add(self.seq)
+            self._expire(now)
+
+
+# ── Pipeline ───────────────────────────────────────────────────────
+class Pipeline:
+    def __init__(self, rules: list[Rule], threshold: float = 1.0):
+        self.rules     = rules
+        self.threshold = threshold
+        patterns: dict[str, str] = {}
+        for r in rules:
+            patterns.update(r.patterns)
+        self.automaton = _Automaton(patterns) if patterns else None
+
+    def scan(self, text: str) -> Features:
+        """The regex and str passes run in C; only the automaton steps through
+        the text in Python, from the first character that starts a pattern,
+        skipping those that start none while it is at the root."""
+        f = Features()
+        f.length      = len(text)
+        f.repeat      = _REPEAT.search(text) is not None
+        f.ascii_alpha = len(_ASCII_ALPHA.findall(text))
+        f.ascii_upper = len(_ASCII_UPPER.findall(text)) if f.ascii_alpha else 0
+        low = text.lower()
+        f.norm = "".join(filter(str.isalnum, low))
+        a = self.automaton
+        m = a.start.search(low) if a is not None else None
+        if m is not None:
+            goto, fail, out, root = a.goto, a.fail, a.out, a.goto[0]
+            hits = f.hits
+            state = 0
+            for ch in low[m.start():]:
+                if not state and ch not in root:
+                    continue
+                while state and ch not in goto[state]:
+                    state = fail[state]
+                state = goto[state].get(ch, 0)
+                if out[state]:
+                    for kind in out[state]:
+                        hits[kind] = hits.get(kind, 0) + 1
+        return f
+
+    def check(self, text: str) -> tuple[float, list[str]]:
+        """(total score, names of the rules that fired)."""
+        f = self.scan(text)
+        total, fired = 0.0, []
+        for r in self.rules:
+            s = r.score(f, text)
+            if s:
+                total += s
+                fired.append(r.name)
+        return total, fired
+
+    def is_spam(self, text: str) -> bool:
+        """Stops at the threshold, so list costly rules (the flood index) last."""
+        f = self.scan(text)
+        total = 0.0
+        for r in self.rules:
+            total += r.score(f, text)
+            if total >= self.threshold:
+                return True
+        return False
+
+
+def load_blocklist(path=SPAM_BLOCKLIST) -> list[str]:
+    try:
+        with open(path, "r", encoding="utf-8") as fh:
+            return [w.strip() for w in fh if w.strip() and not w.startswith("#")]
+    except FileNotFoundError:
+        return []
+
+
+# Built on first use so importing this module reads no files.
+flood_index = FloodIndex()
+_pipeline: Pipeline | None = None
+_pipeline_lock = threading.Lock()
+
+
+def pipeline() -> Pipeline:
+    global _pipeline
+    if _pipeline is None:
+        with _pipeline_lock:
+            if _pipeline is None:
+                _pipeline = Pipeline([
+                    RepeatRule(), ShoutRule(), LinkRule(),
+                    BlocklistRule(load_blocklist()), FloodRule(flood_index),
+                ])
+    return _pipeline
+
+
+def record(text: str):
+    """Feed an accepted comment to the flood index."""
+    flood_index.add(pipeline().scan(text).norm)
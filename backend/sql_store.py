@@ -0,0 +1,284 @@
+from __future__ import annotations
+import sys, threading
+from time import monotonic
+from sqlalchemy import select, update, delete, case, func
+from config import SQL_STATS_TTL
+from models import db, FoodStat, FoodLike, FoodRating, Comment, insert_ignore
+from store import FoodAgg
+from store_backend import StoreBackend
+
+_EMPTY_AGG = FoodAgg()
+
+
+def _split(key: str) -> tuple[str, str]:
+    code, _, name = key.partition("|||")
+    return code, name
+
+
+def _where(model, key: str):
+    code, name = _split(key)
+    return (model.country_code == code, model.food_name == name)
+
+
+class SqlStore(StoreBackend):
+    """Likes, ratings and comments in the SQLAlchemy database.
+
+    Totals live in food_stats and change only through `col = col + n`
+    UPDATEs, so concurrent workers never overwrite each other. Reads of the
+    totals come from an in-process copy of food_stats patched with this
+    worker's own writes. Every SQL_STATS_TTL seconds one aggregate query
+    checks for other workers' writes, and only then is the table re-read.
+    """
+
+    RATING_ATTEMPTS = 3
+
+    def __init__(self):
+        self._lock      = threading.Lock()
+        self._stats:    dict[str, FoodAgg] = {}
+        self._versions: dict[str, int] = {}
+        self._loaded_at: float | None = None
+        self._steps     = threading.local()
+
+    # ── food_stats ──
+    def _bump(self, key: str, **deltas):
+        code, name = _split(key)
+        insert_ignore(FoodStat, [{
+            "country_code": code, "food_name": name, "likes": 0, "rating_sum": 0,
+            "rating_count": 0, "counter_version": 0, "comment_version": 0,
+        }])
+        values = {}
+        for col, d in deltas.items():
+            c = getattr(FoodStat, col)
+            values[col] = case((c + d < 0, 0), else_=c + d) if d < 0 else c + d
+        db.session.execute(update(FoodStat).where(*_where(FoodStat, key)).values(**values))
+        return db.session.execute(
+            select(FoodStat.likes, FoodStat.rating_sum, FoodStat.rating_count,
+                   FoodStat.counter_version).where(*_where(FoodStat, key))
+        ).one()
+
+    def _refresh(self):
+        stats: dict[str, FoodAgg] = {}
+        versions: dict[str, int] = {"*": 0}
+        for code, name, likes, rsum, rcount, ver in db.session.execute(select(
+                FoodStat.country_code, FoodStat.food_name, FoodStat.likes,
+                FoodStat.rating_sum, FoodStat.rating_count, FoodStat.counter_version)):
+            key = f"{code}|||{name}"
+            a = stats[key] = FoodAgg()
+            a.likes, a.rating_sum, a.rating_count = likes, rsum, rcount
+            versions[key]  = ver
+            versions[code] = versions.get(code, 0) + ver
+            versions["*"] += ver
+        with self._lock:
+            self._stats, self._versions = stats, versions
+            self._loaded_at = monotonic()
+
+    def _fresh(self):
+        if self._loaded_at is not None and monotonic() - self._loaded_at <= SQL_STATS_TTL:
+            return
+        if self._loaded_at is not None:
+            # Every like/rating write adds exactly 1 to one row's
+            # counter_version, so the sum moves on any write; max() would
+            # miss writes to rows below the maximum.
+            total = db.session.execute(
+                select(func.coalesce(func.sum(FoodStat.counter_version), 0))
+            ).scalar()
+            if total == self._versions.get("*", 0):
+                self._loaded_at = monotonic()
+                return
+        self._refresh()
+
+    def _patch(self, key: str, row):
+        code, _ = _split(key)
+        with self._lock:
+            a = self._stats[key] = FoodAgg()
+            a.likes, a.rating_sum, a.rating_count = row.likes, row.rating_sum, row.rating_count
+            dv = row.counter_version - self._versions.get(key, 0)
+            self._versions[key] = row.counter_version
+            before = self._versions.get("*", 0)
+            for scope in ("*", code):
+                self._versions[scope] = self._versions.get(scope, 0) + dv
+            self._steps.last = before, before + dv
+
+    def food_agg(self, key: str) -> FoodAgg:
+        self._fresh()
+        return self._stats.get(key, _EMPTY_AGG)
+
+    def counter_version(self, scope: str = "*") -> int:
+        self._fresh()
+        return self._versions.get(scope, 0)
+
+    def write_step(self) -> tuple[int, int] | None:
+        return getattr(self._steps, "last", None)
+
+    # ── Likes ──
+    def like_state(self, key: str, who: str) -> tuple[int, bool]:
+        liked = db.session.execute(
+            select(FoodLike.liker).where(*_where(FoodLike, key), FoodLike.liker == who)
+        ).first() is not None
+        return self.food_agg(key).likes, liked
+
+    def toggle_like(self, key: str, who: str) -> tuple[int, bool]:
+        code, name = _split(key)
+        gone = db.session.execute(
+            delete(FoodLike).where(*_where(FoodLike, key), FoodLike.liker == who)
+        ).rowcount
+        if gone:
+            row = self._bump(key, likes=-1, counter_version=1)
+        else:
+            # A concurrent toggle may have inserted first; count only our row.
+            added = insert_ignore(FoodLike, [{"country_code": code, "food_name": name, "liker": who}])
+            row = self._bump(key, likes=added, counter_version=1)
+        db.session.commit()
+        self._patch(key, row)
+        return row.likes, not gone
+
+    # ── Ratings ──
+    def my_rating(self, key: str, who: str) -> int:
+        return db.session.execute(
+            select(FoodRating.stars).where(*_where(FoodRating, key), FoodRating.rater == who)
+        ).scalar() or 0
+
+    def set_rating(self, key: str, who: str, stars: int) -> int:
+        code, name = _split(key)
+        mine = (*_where(FoodRating, key), FoodRating.rater == who)
+        row  = None
+        # Each pass either updates our row or inserts it; a pass fails only
+        # if a concurrent request inserted or deleted the row in between.
+        for _ in range(self.RATING_ATTEMPTS):
+            old = db.session.execute(
+                select(FoodRating.stars).where(*mine).with_for_update()
+            ).scalar()
+            if old is not None:
+                db.session.execute(update(FoodRating).where(*mine).values(stars=stars))
+                row = self._bump(key, rating_sum=stars - old, counter_version=1)
+                break
+            if insert_ignore(FoodRating, [{"country_code": code, "food_name": name,
+                                           "rater": who, "stars": stars}]):
+                row = self._bump(key, rating_sum=stars, rating_count=1, counter_version=1)
+                break
+        if row is None:
+            db.session.rollback()
+            raise RuntimeError(f"rating of {key} by {who} kept changing concurrently")
+        db.session.commit()
+        self._patch(key, row)
+        return old or 0
+
+    # ── Comments ──
+    def find_comment(self, key: str, comment_id: int) -> dict | None:
+        c = db.session.execute(
+            select(Comment).where(Comment.id == comment_id, *_where(Comment, key))
+        ).scalar()
+        return c.to_dict() if c else None
+
+    def comment_children(self, key: str) -> dict[int | None, list[dict]]:
+        out: dict[int | None, list[dict]] = {}
+        for c in db.session.execute(select(Comment).where(*_where(Comment, key))).scalars():
+            out.setdefault(c.parent_id or None, []).append(c.to_dict())
+        return out
+
+    def comment_version(self, key: str) -> int:
+        return db.session.execute(
+            select(FoodStat.comment_version).where(*_where(FoodStat, key))
+        ).scalar() or 0
+
+    def user_comments(self, user_id: int) -> list[tuple[str, dict]]:
+        return [(f"{c.country_code}|||{c.food_name}", c.to_dict()) for c in
+                db.session.execute(select(Comment).where(Comment.user_id == user_id)).scalars()]
+
+    def add_comment(self, key: str, item: dict):
+        code, name = _split(key)
+        # Ids are millisecond timestamps, so two workers can pick the same one.
+        while not insert_ignore(Comment, [_comment_row(code, name, item)]):
+            item["id"] += 1
+        self._bump(key, comment_version=1)
+        db.session.commit()
+
+    def remove_comment(self, key: str, comment_id: int):
+        db.session.execute(delete(Comment).where(Comment.id == comment_id, *_where(Comment, key)))
+        self._bump(key, comment_version=1)
+        db.session.commit()
+
+    def bump_comment_likes(self, key: str, comment_id: int) -> int | None:
+        mine = (Comment.id == comment_id, *_where(Comment, key))
+        if not db.session.execute(update(Comment).where(*mine).values(likes=Comment.likes + 1)).rowcount:
+            db.session.rollback()
+            return None
+        likes = db.session.execute(select(Comment.likes).where(*mine)).scalar()
+        self._bump(key, comment_version=1)
+        db.session.commit()
+        return likes
+
+
+def _comment_row(code: str, name: str, c: dict) -> dict:
+    return {
+        "id":           c["id"],
+        "country_code": code,
+        "food_name":    name,
+        "parent_id":    c.get("parent_id"),
+        "user_id":      c.get("user_id"),
+        "author":       c.get("user") or "",
+        "text":         c.get("text") or "",
+        "ts":           c.get("ts") or 0,
+        "likes":        c.get("likes", 0),
+        "delete_token": c.get("delete_token"),
+    }
+
+
+# ── JSON Import ────────────────────────────────────────────────────
+def import_json(likes: dict, ratings: dict, comments: dict):
+    """One-shot copy of the JSON store into the SQL tables.
+
+    Rows that already exist are left alone, so an interrupted import can be
+    re-run. Legacy bare-int like counts keep their count without likers.
+    """
+    stats: dict[str, dict] = {}
+
+    def stat(key: str) -> dict:
+        if key not in stats:
+            code, name = _split(key)
+            stats[key] = {"country_code": code, "food_name": name, "likes": 0, "rating_sum": 0,
+                          "rating_count": 0, "counter_version": 1, "comment_version": 1}
+        return stats[key]
+
+    like_rows, rating_rows, comment_rows = [], [], []
+    for key, entry in likes.items():
+        code, name = _split(key)
+        if isinstance(entry, int):
+            stat(key)["likes"] = entry
+            continue
+        stat(key)["likes"] = int(entry.get("count", 0))
+        like_rows += [{"country_code": code, "food_name": name, "liker": who}
+                      for who in entry.get("liked_by", [])]
+    for key, entry in ratings.items():
+        code, name = _split(key)
+        for who, stars in (entry or {}).get("user_ratings", {}).items():
+            rating_rows.append({"country_code": code, "food_name": name, "rater": who, "stars": stars})
+            stat(key)["rating_sum"]   += stars
+            stat(key)["rating_count"] += 1
+    for key, lst in comments.items():
+        code, name = _split(key)
+        stat(key)
+        comment_rows += [_comment_row(code, name, c) for c in lst]
+
+    added = {
+        "foods":    insert_ignore(FoodStat,   list(stats.values())),
+        "likes":    insert_ignore(FoodLike,   like_rows),
+        "ratings":  insert_ignore(FoodRating, rating_rows),
+        "comments": insert_ignore(Comment,    comment_rows),
+    }
+    db.session.commit()
+    return added
+
+
+if __name__ == "__main__":
+    # python sql_store.py import-json
+    if sys.argv[1:] != ["import-json"]:
+        sys.exit("usage: python sql_store.py import-json")
+    import store
+    from app import app
+    from migrations import migrate
+    from config import LIKES_JSON, RATINGS_JSON, COMMENTS_JSON
+    with app.app_context():
+        migrate(db.engine)
+        print(import_json(store.export(LIKES_JSON), store.export(RATINGS_JSON),
+                          store.export(COMMENTS_JSON)))
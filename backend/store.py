@@ -1,66 +1,962 @@
 from __future__ import annotations
-import json, os, tempfile, threading
+import atexit
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import threading
+from array import array
+from bisect import bisect_left
+from contextlib import contextmanager
 from json import JSONDecodeError
 from pathlib import Path
-from config import FOODS_JSON, LIKES_JSON, COMMENTS_JSON, RATINGS_JSON
+from time import sleep, time
+from config import (
+    FOODS_JSON, LIKES_JSON, COMMENTS_JSON, RATINGS_JSON,
+    STORE_MODE, WAL_COMPACT_EVERY, WAL_COMPACT_INTERVAL,
+    STORE_FLUSH_MS, STORE_FLUSH_MAX, STORE_DURABLE_ACK, STORE_SHARED,
+    STORE_BACKEND, FOODS_WATCH_INTERVAL,
+)
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process locking, STORE_SHARED unavailable
+    fcntl = None
 
 _lock = threading.Lock()
 
 
-def _atomic_write(path: Path, obj):
+def _json_default(o):
+    if isinstance(o, set):
+        return list(o)
+    if isinstance(o, (_Likes, _Ratings)):
+        return o.to_json()
+    raise TypeError(f"{type(o).__name__} is not JSON serializable")
+
+
+def _dumps(obj) -> str:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=_json_default)
+
+
+def _atomic_write_bytes(path: Path, data: bytes):
     path.parent.mkdir(parents=True, exist_ok=True)
-    with tempfile.NamedTemporaryFile("w", delete=False, encoding="utf-8",
-                                     dir=str(path.parent)) as tmp:
-        json.dump(obj, tmp, ensure_ascii=False, separators=(",", ":"))
+    with tempfile.NamedTemporaryFile("wb", delete=False, dir=str(path.parent)) as tmp:
+        tmp.write(data)
         tmp.flush()
         os.fsync(tmp.fileno())
         tmp_path = tmp.name
     os.replace(tmp_path, path)
 
 
+def _atomic_write(path: Path, obj):
+    _atomic_write_bytes(path, _dumps(obj).encode("utf-8"))
+
+
 def save_json(path: Path, obj):
     with _lock:
         _atomic_write(path, obj)
 
 
-def load_json(path: Path, default):
+_file_locks: dict[Path, threading.Lock] = {}  # file_lock() without fcntl
+_file_locks_guard = threading.Lock()
+
+
+@contextmanager
+def file_lock(path: Path):
+    """Exclusive lock on <path>.lock, held against other threads and processes
+    (only threads without fcntl). Never _lock: save_json() runs inside it."""
+    if fcntl is None:
+        with _file_locks_guard:
+            lock = _file_locks.setdefault(path, threading.Lock())
+        with lock:
+            yield
+        return
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path.with_name(path.name + ".lock"), "ab") as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def load_json(path: Path, default, create: bool = True):
+    """File contents, or `default` (also written to the file when `create`)."""
     try:
         with open(path, "r", encoding="utf-8") as f:
             raw = f.read().strip()
-        if not raw:
-            save_json(path, default)
-            return default
-        return json.loads(raw)
-    except FileNotFoundError:
+        if raw:
+            return json.loads(raw)
+    except (FileNotFoundError, JSONDecodeError):
+        pass
+    if create:
         save_json(path, default)
-        return default
-    except JSONDecodeError:
-        save_json(path, default)
-        return default
+    return default
 
 
-_foods_cache: dict = {"mtime": None, "data": {}}
+# ── Catalog ────────────────────────────────────────────────────────
+# The snapshot dict is replaced as a whole, never updated in place, so a
+# reader always sees matching data and version. "sig" identifies the file
+# contents we loaded; "version" increases on every swap so derived indexes
+# and caches know when to rebuild.
+_foods_cache: dict = {"sig": None, "data": {}, "version": 0}
+_foods_lock = threading.Lock()
+_foods_watcher: threading.Thread | None = None
+_watcher_lock = threading.Lock()
 
 
-def load_foods_json(force: bool = False) -> dict:
-    global _foods_cache
+def _foods_sig():
+    # mtime alone misses two writes within the filesystem's timestamp granularity.
     try:
         st = os.stat(FOODS_JSON)
     except FileNotFoundError:
-        _foods_cache.update({"mtime": None, "data": {}})
-        return _foods_cache["data"]
-    if force or _foods_cache["mtime"] != st.st_mtime:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+def _reload_foods(sig, force: bool = False):
+    global _foods_cache
+    with _foods_lock:
+        cur = _foods_cache
+        if sig == cur["sig"] and not force:
+            return
+        data = {}
+        if sig is not None:
+            try:
+                with open(FOODS_JSON, "r", encoding="utf-8") as f:
+                    raw = f.read().strip()
+                data = json.loads(raw) if raw else None
+            except (FileNotFoundError, JSONDecodeError, UnicodeDecodeError):
+                data = None
+            if not isinstance(data, dict):
+                if cur["data"]:
+                    return  # half-written file: keep serving the last good catalog
+                data, sig = {}, None
+        _foods_cache = {"sig": sig, "data": data, "version": cur["version"] + 1}
+
+
+def _watch_foods():
+    while True:
+        sleep(FOODS_WATCH_INTERVAL)
+        try:
+            _reload_foods(_foods_sig())
+        except OSError:
+            pass
+
+
+def _ensure_foods_watcher():
+    # Published only after the first load: a request that sees the watcher
+    # must also see the catalog.
+    global _foods_watcher
+    if _foods_watcher is None:
+        with _watcher_lock:
+            if _foods_watcher is not None:
+                return
+            _reload_foods(_foods_sig())
+            watcher = threading.Thread(target=_watch_foods, name="foods-watcher", daemon=True)
+            watcher.start()
+            _foods_watcher = watcher
+
+
+def foods_snapshot(force: bool = False) -> tuple[dict, int]:
+    """(catalog, version). With FOODS_WATCH_INTERVAL > 0 a background thread
+    polls foods.json and requests never touch the file system."""
+    if FOODS_WATCH_INTERVAL > 0 and not force:
+        _ensure_foods_watcher()
+    else:
+        _reload_foods(_foods_sig(), force)
+    cur = _foods_cache
+    return cur["data"], cur["version"]
+
+
+def load_foods_json(force: bool = False) -> dict:
+    return foods_snapshot(force)[0]
+
+
+# ── Interning ──────────────────────────────────────────────────────
+# Likers and raters ("user:12", "ip:1.2.3.4") are small ints in memory, kept
+# in sorted arrays per food, and food keys go through sys.intern() so every
+# dict shares one string per food. The legacy strings reappear only at the
+# JSON boundary: snapshots, WAL records and export().
+class _Interner:
+    def __init__(self):
+        self.ids:   dict[str, int] = {}
+        self.names: list[str] = []
+        self.lock   = threading.Lock()
+
+    def id(self, name: str) -> int:
+        i = self.ids.get(name)
+        if i is None:
+            with self.lock:
+                i = self.ids.get(name)
+                if i is None:
+                    i = self.ids[name] = len(self.names)
+                    self.names.append(name)
+        return i
+
+
+_actors = _Interner()
+
+
+def _find(arr: array, v: int) -> int:
+    """Position of v in the sorted array, or -1."""
+    i = bisect_left(arr, v)
+    return i if i < len(arr) and arr[i] == v else -1
+
+
+class _Likes:
+    __slots__ = ("count", "liked_by")
+
+    def __init__(self, count: int = 0, liked_by=()):
+        self.count    = count
+        self.liked_by = array("I", sorted(liked_by))
+
+    @classmethod
+    def from_json(cls, raw) -> "_Likes":
+        # Legacy entries are a bare count.
+        if isinstance(raw, int):
+            return cls(raw)
+        return cls(int(raw.get("count", 0)), {_actors.id(w) for w in raw.get("liked_by", [])})
+
+    def to_json(self) -> dict:
+        names = _actors.names
+        return {"count": self.count, "liked_by": [names[a] for a in self.liked_by]}
+
+    def has(self, actor: int | None) -> bool:
+        return actor is not None and _find(self.liked_by, actor) >= 0
+
+    def add(self, actor: int):
+        i = bisect_left(self.liked_by, actor)
+        if i == len(self.liked_by) or self.liked_by[i] != actor:
+            self.liked_by.insert(i, actor)
+
+    def discard(self, actor: int):
+        i = _find(self.liked_by, actor)
+        if i >= 0:
+            del self.liked_by[i]
+
+
+def _stars(v) -> int | None:
+    """A stored rating as an int 1-5 (old files may hold 4.0), None if it is
+    not one."""
+    try:
+        v = int(v)
+    except (TypeError, ValueError):
+        return None
+    return v if 1 <= v <= 5 else None
+
+
+class _Ratings:
+    """Parallel arrays: sorted rater ids and their stars."""
+    __slots__ = ("raters", "stars")
+
+    def __init__(self, pairs=()):
+        pairs = sorted(pairs)
+        self.raters = array("I", [a for a, _ in pairs])
+        self.stars  = array("B", [int(v) for _, v in pairs])
+
+    @classmethod
+    def from_json(cls, raw) -> "_Ratings":
+        # Entries that are not a 1-5 rating are dropped: array("B") cannot
+        # hold them and the API never wrote them.
+        pairs = ((w, _stars(v)) for w, v in (raw or {}).get("user_ratings", {}).items())
+        return cls((_actors.id(w), v) for w, v in pairs if v is not None)
+
+    def to_json(self) -> dict:
+        names = _actors.names
+        return {"user_ratings": {names[a]: v for a, v in zip(self.raters, self.stars)}}
+
+    def get(self, actor: int | None) -> int | None:
+        i = -1 if actor is None else _find(self.raters, actor)
+        return self.stars[i] if i >= 0 else None
+
+    def set(self, actor: int, stars: int) -> int | None:
+        """Returns the previous stars, None if `actor` had not rated."""
+        stars = int(stars)
+        i = bisect_left(self.raters, actor)
+        if i < len(self.raters) and self.raters[i] == actor:
+            old, self.stars[i] = self.stars[i], stars
+            return old
+        self.raters.insert(i, actor)
+        self.stars.insert(i, stars)
+        return None
+
+
+def _decode(path: Path, data: dict) -> dict:
+    """File contents -> in-memory entries."""
+    if path == LIKES_JSON:
+        return {sys.intern(k): _Likes.from_json(v) for k, v in data.items()}
+    if path == RATINGS_JSON:
+        return {sys.intern(k): _Ratings.from_json(v) for k, v in data.items()}
+    return data
+
+
+def export(path: Path) -> dict:
+    """One store in its JSON file shape, with the legacy key and actor strings."""
+    _ensure_loaded()
+    with _store_locks[path]:
+        return json.loads(_dumps(_stores[path]))
+
+
+# Filled in place by load(); the dict objects themselves never change.
+likes_store:    dict[str, _Likes] = {}
+comments_store: dict[str, list[dict]] = {}
+ratings_store:  dict[str, _Ratings] = {}
+
+_stores = {
+    LIKES_JSON:    likes_store,
+    COMMENTS_JSON: comments_store,
+    RATINGS_JSON:  ratings_store,
+}
+# One lock per store file so a like never waits behind a comment write.
+_store_locks = {path: threading.Lock() for path in _stores}
+
+
+# ── Write-Ahead Log ────────────────────────────────────────────────
+# Every record sets state rather than deltas it ("liked = true, count = 12"),
+# so replaying a record the snapshot already contains is harmless. That lets
+# compaction write the snapshot first and trim the log afterwards.
+class _Journal:
+    def __init__(self, path: Path):
+        self.path     = path
+        self.log_path = path.with_name(path.name + ".log")
+        self.fh       = None
+        self.pending  = 0
+        self.buf: list[bytes] = []
+        self.io       = threading.Lock()  # guards fh and the log file itself
+        self.offset   = 0                 # log bytes already applied (STORE_SHARED)
+
+    def append(self, rec: dict):
+        """Caller holds the store lock."""
+        line = (_dumps(rec) + "\n").encode("utf-8")
+        if _flusher:
+            self.buf.append(line)
+        else:
+            with self.io:
+                self._write([line])
+        self.pending += 1
+        if self.pending >= WAL_COMPACT_EVERY:
+            _compact_wakeup.set()
+
+    def _write(self, lines: list[bytes]):
+        if self.fh is None:
+            self.fh = open(self.log_path, "ab")
+        self.fh.write(b"".join(lines))
+        self.fh.flush()
+        os.fsync(self.fh.fileno())
+        self.offset = self.fh.tell()
+
+    def flush(self):
+        with _store_locks[self.path]:
+            lines, self.buf = self.buf, []
+        if lines:
+            with self.io:
+                self._write(lines)
+
+    def records(self, start: int = 0):
+        try:
+            with open(self.log_path, "rb") as f:
+                f.seek(start)
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except (JSONDecodeError, UnicodeDecodeError):
+                        continue  # torn tail from a crash mid-append
+        except FileNotFoundError:
+            return
+
+    def tail(self) -> list[dict]:
+        """Records appended since the last tail() or own append. Caller holds _locked()."""
+        try:
+            end = self.log_path.stat().st_size
+        except FileNotFoundError:
+            return []
+        recs = list(self.records(self.offset))
+        self.offset = end
+        return recs
+
+    def close(self):
+        with self.io:
+            if self.fh:
+                self.fh.close()
+                self.fh = None
+
+    def compact(self):
+        if STORE_SHARED:
+            # Other workers track offsets into this log, so it is only ever
+            # dropped whole, under the shared lock, with a new generation.
+            with _locked(self.path):
+                _atomic_write(self.path, _stores[self.path])
+                self.close()
+                try:
+                    os.unlink(self.log_path)
+                except FileNotFoundError:
+                    pass
+                self.pending = self.offset = 0
+                _stamps[self.path].bump(compacted=True)
+            return
+        with _store_locks[self.path], self.io:
+            # Everything already in the log is reflected in memory.
+            try:
+                offset = self.log_path.stat().st_size
+            except FileNotFoundError:
+                offset = 0
+            data   = _dumps(_stores[self.path]).encode("utf-8")
+            self.pending = 0
+        _atomic_write_bytes(self.path, data)
+        with self.io:
+            if self.fh:
+                self.fh.close()
+                self.fh = None
+            try:
+                with open(self.log_path, "rb") as f:
+                    f.seek(offset)
+                    tail = f.read()
+            except FileNotFoundError:
+                return
+            if tail:
+                _atomic_write_bytes(self.log_path, tail)
+            else:
+                os.unlink(self.log_path)
+
+
+_journals = {path: _Journal(path) for path in _stores}
+
+
+# ── Shared Mode ────────────────────────────────────────────────────
+# <file>.ver holds a (generation, seq) stamp and doubles as the fcntl lock
+# file. seq increases on every write; generation increases when the WAL is
+# compacted away, which invalidates the log offsets other workers hold. Each
+# process remembers the stamp its dicts reflect and catches up when the file
+# says otherwise: by reading the log tail, or by reloading the snapshot.
+_STAMP = struct.Struct("<QQ")
+
+
+class _Stamp:
+    def __init__(self, path: Path):
+        if fcntl is None:
+            raise RuntimeError("STORE_SHARED requires fcntl (POSIX)")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.fd = os.open(path.with_name(path.name + ".ver"), os.O_RDWR | os.O_CREAT, 0o644)
+        if os.fstat(self.fd).st_size < _STAMP.size:
+            os.ftruncate(self.fd, _STAMP.size)
+        self.map  = mmap.mmap(self.fd, _STAMP.size)
+        self.seen: tuple[int, int] | None = None  # None: never loaded under the lock
+
+    def read(self) -> tuple[int, int]:
+        return _STAMP.unpack_from(self.map)
+
+    def bump(self, compacted: bool = False):
+        """Caller holds the lock and is caught up."""
+        gen, seq = self.read()
+        self.seen = (gen + compacted, seq + 1)
+        _STAMP.pack_into(self.map, 0, *self.seen)
+
+
+_stamps: dict[Path, _Stamp] = {}  # filled by load() when STORE_SHARED
+
+
+@contextmanager
+def _locked(path: Path):
+    """The store lock; with STORE_SHARED also the cross-process lock, entered
+    with this process caught up on every other worker's writes."""
+    _ensure_loaded()
+    with _store_locks[path]:
+        if not STORE_SHARED:
+            yield
+            return
+        fd = _stamps[path].fd
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            _catch_up(path)
+            yield
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+
+
+def _catch_up(path: Path):
+    st, j = _stamps[path], _journals[path]
+    cur = st.read()
+    if cur == st.seen:
+        return
+    if STORE_MODE == "wal" and st.seen is not None and cur[0] == st.seen[0]:
+        recs = j.tail()
+    else:
+        _reload_store(path)
+        j.close()
+        j.offset = 0
+        recs = j.tail() if STORE_MODE == "wal" else []
+    for rec in recs:
+        _APPLY[rec["op"]](rec)
+    st.seen = cur
+
+
+def _reload_store(path: Path):
+    try:
+        data = json.loads(path.read_text(encoding="utf-8") or "null")
+    except (FileNotFoundError, JSONDecodeError, UnicodeDecodeError):
+        data = None
+    if not isinstance(data, dict):
+        data = {}
+    data = _decode(path, data)
+    # Update in place: the dicts are shared with the indexes and other modules.
+    live = _stores[path]
+    live.update(data)
+    for k in live.keys() - data.keys():
+        del live[k]
+    if path == COMMENTS_JSON:
+        rebuild_comment_indexes()
+    else:
+        rebuild_aggregates(path)
+
+
+def sync():
+    """Apply writes other workers made since the last call; no-op unless STORE_SHARED."""
+    if not _loaded:
+        return  # load() will read the latest state anyway
+    for path, st in _stamps.items():
+        if st.read() != st.seen:
+            with _locked(path):
+                pass
+
+
+_compact_wakeup = threading.Event()
+
+
+def compact_all():
+    for j in _journals.values():
+        if j.pending or j.log_path.exists():
+            j.compact()
+
+
+def _compactor():
+    while True:
+        _compact_wakeup.wait(WAL_COMPACT_INTERVAL)
+        _compact_wakeup.clear()
+        try:
+            compact_all()
+        except OSError:
+            pass  # retried on the next tick; the log still holds everything
+
+
+# ── Group Commit ───────────────────────────────────────────────────
+class _Flusher:
+    """Coalesces mutations into one write + fsync per batch.
+
+    mark() hands out increasing tickets; once a batch containing ticket t is on
+    disk, `done` reaches t and every request waiting on it is released.
+    """
+
+    def __init__(self):
+        self.cond    = threading.Condition()
+        self.dirty: set[Path] = set()
+        self.pending = 0
+        self.seq     = 0
+        self.done    = 0
+        self.stopped = False
+        self.thread  = threading.Thread(target=self._run, name="store-flusher", daemon=True)
+        self.thread.start()
+
+    def mark(self, path: Path) -> int:
+        with self.cond:
+            idle = not self.dirty
+            self.dirty.add(path)
+            self.seq     += 1
+            self.pending += 1
+            if idle or self.pending >= STORE_FLUSH_MAX:
+                self.cond.notify_all()
+            return self.seq
+
+    def wait(self, ticket: int):
+        with self.cond:
+            while self.done < ticket and not self.stopped:
+                self.cond.wait()
+
+    def stop(self):
+        with self.cond:
+            self.stopped = True
+            self.cond.notify_all()
+        self.thread.join()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.dirty and not self.stopped:
+                    self.cond.wait()
+                if not self.dirty:
+                    return
+                deadline = time() + STORE_FLUSH_MS / 1000
+                while self.pending < STORE_FLUSH_MAX and not self.stopped:
+                    remaining = deadline - time()
+                    if remaining <= 0:
+                        break
+                    self.cond.wait(remaining)
+                paths, self.dirty = self.dirty, set()
+                target, self.pending = self.seq, 0
+            try:
+                for path in paths:
+                    _flush(path)
+            except OSError:
+                with self.cond:
+                    self.dirty |= paths  # retry with the next batch
+                    if self.stopped:
+                        return
+                continue
+            with self.cond:
+                self.done = target
+                self.cond.notify_all()
+
+
+def _flush(path: Path):
+    if STORE_MODE == "wal":
+        _journals[path].flush()
+        return
+    with _store_locks[path]:
+        data = _dumps(_stores[path]).encode("utf-8")
+    with _lock:
+        _atomic_write_bytes(path, data)
+
+
+_flusher: _Flusher | None = None  # started by load() when STORE_FLUSH_MS > 0
+
+
+def _commit(path: Path, rec: dict) -> int:
+    """Persist one mutation already applied in memory. Caller holds the store lock.
+
+    Returns a ticket for _durable(), which must be called after releasing it.
+    """
+    if STORE_MODE == "wal":
+        _journals[path].append(rec)
+    elif not _flusher:
+        save_json(path, _stores[path])
+    if STORE_SHARED:
+        _stamps[path].bump()
+    return _flusher.mark(path) if _flusher else 0
+
+
+def _durable(ticket: int):
+    if ticket and STORE_DURABLE_ACK:
+        _flusher.wait(ticket)
+
+
+# ── Aggregates ─────────────────────────────────────────────────────
+# Running per-food totals, so reading stats never walks the rater/liker lists.
+class FoodAgg:
+    __slots__ = ("rating_sum", "rating_count", "likes")
+
+    def __init__(self):
+        self.rating_sum   = 0
+        self.rating_count = 0
+        self.likes        = 0
+
+
+_EMPTY_AGG = FoodAgg()
+_agg: dict[str, FoodAgg] = {}
+
+
+def food_agg(key: str) -> FoodAgg:
+    _ensure_loaded()
+    return _agg.get(key, _EMPTY_AGG)
+
+
+def _agg_entry(key: str) -> FoodAgg:
+    a = _agg.get(key)
+    if a is None:  # likes and ratings writers may race to add a key
+        a = _agg.setdefault(key, FoodAgg())
+    return a
+
+
+# Like/rating change counters for cache invalidation: one overall, one per
+# country code and one per food key. rebuild_aggregates() starts a new epoch,
+# which invalidates all of them at once.
+_counter_epoch = 0
+_counter_versions: dict[str, int] = {}
+_counter_lock  = threading.Lock()  # likes and ratings are written under different locks
+_counter_steps = threading.local()
+
+
+def _touch_counters(key: str):
+    code = key.partition("|||")[0]
+    with _counter_lock:
+        before = _counter_epoch, _counter_versions.get("*", 0)
+        for k in ("*", code, key):
+            _counter_versions[k] = _counter_versions.get(k, 0) + 1
+        _counter_steps.last = before, (_counter_epoch, _counter_versions["*"])
+
+
+def write_step() -> tuple | None:
+    """(counter_version() just before, just after) the last like/rating
+    change applied by this thread, which after a write is that write's."""
+    return getattr(_counter_steps, "last", None)
+
+
+def counter_version(scope: str = "*") -> tuple[int, int]:
+    """Version of like/rating totals for "*" (everything), a country code or a kstr."""
+    _ensure_loaded()
+    return _counter_epoch, _counter_versions.get(scope, 0)
+
+
+def rebuild_aggregates(path: Path | None = None):
+    """Recompute the totals of one store (LIKES_JSON or RATINGS_JSON), or of
+    both. Field by field and in place, under that store's lock only: writers
+    of the other store keep updating their own fields meanwhile."""
+    global _counter_epoch
+    if path in (None, LIKES_JSON):
+        for key, a in list(_agg.items()):
+            if key not in likes_store:
+                a.likes = 0
+        for key, entry in likes_store.items():
+            _agg_entry(key).likes = entry.count
+    if path in (None, RATINGS_JSON):
+        for key, a in list(_agg.items()):
+            if key not in ratings_store:
+                a.rating_sum = a.rating_count = 0
+        for key, entry in ratings_store.items():
+            a = _agg_entry(key)
+            a.rating_sum   = sum(entry.stars)
+            a.rating_count = len(entry.stars)
+    with _counter_lock:
+        _counter_epoch += 1
+
+
+# ── Comment Indexes ────────────────────────────────────────────────
+# All indexes share the comment dicts held in comments_store, so a comment
+# like shows up everywhere without reindexing.
+#   _comment_ids:   kstr -> {comment_id: comment}
+#   _children:      kstr -> {parent_id or None: [comment, ...]}
+#   _user_comments: user_id -> {comment_id: (kstr, comment)}
+# _comment_versions[kstr] increases on every mutation of that food's thread.
+_comment_ids:      dict[str, dict[int, dict]] = {}
+_children:         dict[str, dict[int | None, list[dict]]] = {}
+_user_comments:    dict[int, dict[int, tuple[str, dict]]] = {}
+_comment_versions: dict[str, int] = {}
+
+
+def _index_comment(key: str, c: dict):
+    _comment_ids.setdefault(key, {})[c["id"]] = c
+    _children.setdefault(key, {}).setdefault(c.get("parent_id") or None, []).append(c)
+    if c.get("user_id") is not None:
+        _user_comments.setdefault(c["user_id"], {})[c["id"]] = (key, c)
+
+
+def _unindex_comment(key: str, c: dict):
+    _comment_ids.get(key, {}).pop(c["id"], None)
+    siblings = _children.get(key, {}).get(c.get("parent_id") or None, [])
+    idx = next((i for i, x in enumerate(siblings) if x is c), None)
+    if idx is not None:
+        siblings.pop(idx)
+    mine = _user_comments.get(c.get("user_id"))
+    if mine is not None:
+        mine.pop(c["id"], None)
+
+
+def _touch_comments(key: str):
+    _comment_versions[key] = _comment_versions.get(key, 0) + 1
+
+
+def rebuild_comment_indexes():
+    _comment_ids.clear()
+    _children.clear()
+    _user_comments.clear()
+    for key, lst in comments_store.items():
+        for c in lst:
+            _index_comment(key, c)
+        _touch_comments(key)
+
+
+def user_comments(user_id: int) -> list[tuple[str, dict]]:
+    _ensure_loaded()
+    return list(_user_comments.get(user_id, {}).values())
+
+
+def comment_children(key: str) -> dict[int | None, list[dict]]:
+    """parent_id (None for top level) -> comments, in insertion order."""
+    _ensure_loaded()
+    return _children.get(key, {})
+
+
+def comment_version(key: str) -> int:
+    _ensure_loaded()
+    return _comment_versions.get(key, 0)
+
+
+# ── Mutations ──────────────────────────────────────────────────────
+_NO_LIKES = _Likes()
+
+
+def _apply_like(rec: dict):
+    key   = sys.intern(rec["k"])
+    entry = likes_store.get(key)
+    if entry is None:
+        entry = likes_store[key] = _Likes()
+    if rec["on"]:
+        entry.add(_actors.id(rec["who"]))
+    else:
+        entry.discard(_actors.id(rec["who"]))
+    entry.count = rec["n"]
+    _agg_entry(key).likes = rec["n"]
+    _touch_counters(key)
+
+
+def _apply_rate(rec: dict):
+    key   = sys.intern(rec["k"])
+    entry = ratings_store.get(key)
+    if entry is None:
+        entry = ratings_store[key] = _Ratings()
+    v   = int(rec["v"])
+    old = entry.set(_actors.id(rec["who"]), v)
+    a = _agg_entry(key)
+    a.rating_sum += v - (old or 0)
+    if old is None:
+        a.rating_count += 1
+    _touch_counters(rec["k"])
+
+
+def _apply_comment_add(rec: dict):
+    if rec["c"]["id"] in _comment_ids.get(rec["k"], {}):
+        return
+    comments_store.setdefault(rec["k"], []).append(rec["c"])
+    _index_comment(rec["k"], rec["c"])
+    _touch_comments(rec["k"])
+
+
+def _apply_comment_del(rec: dict):
+    c = find_comment(rec["k"], rec["id"])
+    if c is None:
+        return
+    lst = comments_store[rec["k"]]
+    lst.pop(next(i for i, x in enumerate(lst) if x is c))
+    _unindex_comment(rec["k"], c)
+    _touch_comments(rec["k"])
+
+
+def _apply_comment_like(rec: dict):
+    c = find_comment(rec["k"], rec["id"])
+    if c is not None:
+        c["likes"] = rec["n"]
+        _touch_comments(rec["k"])
+
+
+_APPLY = {
+    "like":  _apply_like,
+    "rate":  _apply_rate,
+    "cadd":  _apply_comment_add,
+    "cdel":  _apply_comment_del,
+    "clike": _apply_comment_like,
+}
+
+
+def _mutate(path: Path, rec: dict) -> int:
+    _APPLY[rec["op"]](rec)
+    return _commit(path, rec)
+
+
+def like_state(key: str, who: str) -> tuple[int, bool]:
+    _ensure_loaded()
+    entry = likes_store.get(key, _NO_LIKES)
+    return entry.count, entry.has(_actors.ids.get(who))
+
+
+def my_rating(key: str, who: str) -> int:
+    _ensure_loaded()
+    entry = ratings_store.get(key)
+    return (entry.get(_actors.ids.get(who)) if entry else None) or 0
+
+
+def toggle_like(key: str, who: str) -> tuple[int, bool]:
+    with _locked(LIKES_JSON):
+        entry = likes_store.get(key, _NO_LIKES)
+        on = not entry.has(_actors.ids.get(who))
+        n  = entry.count + 1 if on else max(0, entry.count - 1)
+        ticket = _mutate(LIKES_JSON, {"op": "like", "k": key, "who": who, "on": on, "n": n})
+    _durable(ticket)
+    return n, on
+
+
+def set_rating(key: str, who: str, stars: int) -> int:
+    with _locked(RATINGS_JSON):
+        entry = ratings_store.get(key)
+        old = entry.get(_actors.ids.get(who)) if entry else None
+        ticket = _mutate(RATINGS_JSON, {"op": "rate", "k": key, "who": who, "v": stars})
+    _durable(ticket)
+    return old or 0
+
+
+def find_comment(key: str, comment_id: int) -> dict | None:
+    _ensure_loaded()
+    return _comment_ids.get(key, {}).get(comment_id)
+
+
+def add_comment(key: str, item: dict):
+    with _locked(COMMENTS_JSON):
+        ticket = _mutate(COMMENTS_JSON, {"op": "cadd", "k": key, "c": item})
+    _durable(ticket)
+
+
+def remove_comment(key: str, comment_id: int):
+    with _locked(COMMENTS_JSON):
+        ticket = _mutate(COMMENTS_JSON, {"op": "cdel", "k": key, "id": comment_id})
+    _durable(ticket)
+
+
+def bump_comment_likes(key: str, comment_id: int) -> int | None:
+    with _locked(COMMENTS_JSON):
+        c = find_comment(key, comment_id)
+        if c is None:
+            return None
+        n = c.get("likes", 0) + 1
+        ticket = _mutate(COMMENTS_JSON, {"op": "clike", "k": key, "id": comment_id, "n": n})
+    _durable(ticket)
+    return n
+
+
+# ── Loading ────────────────────────────────────────────────────────
+# Nothing is read at import time. load() runs on first use of any public
+# accessor or mutation; scripts that touch the dicts directly call it first.
+# With STORE_BACKEND=sql the files are only read (by `sql_store.py
+# import-json`): nothing is created, compacted or flushed.
+_READ_ONLY  = STORE_BACKEND == "sql"
+_loaded     = False
+_loading    = False
+_load_lock  = threading.RLock()
+
+
+def _ensure_loaded():
+    if not _loaded:
+        load()
+
+
+def load():
+    global _loaded, _loading, _flusher
+    with _load_lock:
+        if _loaded or _loading:
+            return  # done, or re-entered from the steps below
+        _loading = True
         try:
-            with open(FOODS_JSON, "r", encoding="utf-8") as f:
-                raw = f.read().strip()
-            data = json.loads(raw) if raw else {}
-        except (FileNotFoundError, JSONDecodeError):
-            data = {}
-        _foods_cache["data"] = data
-        _foods_cache["mtime"] = st.st_mtime
-    return _foods_cache["data"]
-
-
-likes_store    = load_json(LIKES_JSON,    {})
-comments_store = load_json(COMMENTS_JSON, {})
-ratings_store  = load_json(RATINGS_JSON,  {})
+            for path, live in _stores.items():
+                live.update(_decode(path, load_json(path, {}, create=not _READ_ONLY)))
+            # Indexes first: replaying the log maintains them incrementally.
+            rebuild_aggregates()
+            rebuild_comment_indexes()
+            if STORE_SHARED and not _READ_ONLY:
+                _stamps.update((path, _Stamp(path)) for path in _stores)
+                for path in _stores:
+                    with _locked(path):
+                        pass  # first catch-up reloads under the lock, log included
+            elif STORE_MODE == "wal":
+                for j in _journals.values():
+                    for rec in j.records():
+                        _APPLY[rec["op"]](rec)
+            if STORE_MODE == "wal" and not _READ_ONLY:
+                compact_all()
+                threading.Thread(target=_compactor, name="wal-compactor", daemon=True).start()
+            # Shared mode writes through: a buffered record could be computed
+            # from state another worker has already changed.
+            if STORE_FLUSH_MS > 0 and not STORE_SHARED and not _READ_ONLY:
+                _flusher = _Flusher()
+                atexit.register(_flusher.stop)
+            _loaded = True
+        finally:
+            _loading = False
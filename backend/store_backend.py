@@ -0,0 +1,147 @@
+from __future__ import annotations
+import threading
+from abc import ABC, abstractmethod
+from collections.abc import Hashable
+import store
+from config import STORE_BACKEND
+
+
+class StoreBackend(ABC):
+    """Storage engine for likes, ratings and comments.
+
+    Food keys are kstr() strings ("JP|||壽司"); likers and raters are
+    "user:<id>" / "ip:<addr>" strings; comments are the dicts the API returns
+    (including delete_token).
+    """
+
+    def refresh(self):
+        """Called before each request; picks up other workers' writes if needed."""
+
+    # ── Likes / Ratings ──
+    @abstractmethod
+    def like_state(self, key: str, who: str) -> tuple[int, bool]:
+        """(like count, whether `who` has liked it)."""
+
+    @abstractmethod
+    def toggle_like(self, key: str, who: str) -> tuple[int, bool]:
+        """Flips `who`'s like; returns the new (count, liked)."""
+
+    @abstractmethod
+    def my_rating(self, key: str, who: str) -> int:
+        """`who`'s stars for the food, 0 if unrated."""
+
+    @abstractmethod
+    def set_rating(self, key: str, who: str, stars: int) -> int:
+        """Sets `who`'s stars; returns the previous ones, 0 if unrated."""
+
+    @abstractmethod
+    def food_agg(self, key: str) -> store.FoodAgg:
+        """Totals for one food; must be O(1)."""
+
+    @abstractmethod
+    def counter_version(self, scope: str = "*") -> Hashable:
+        """Changes whenever a like/rating total in `scope` ("*", country code or kstr) does."""
+
+    @abstractmethod
+    def write_step(self) -> tuple[Hashable, Hashable] | None:
+        """(counter_version() just before, just after) this thread's last
+        toggle_like()/set_rating(); None if unknown."""
+
+    # ── Comments ──
+    @abstractmethod
+    def find_comment(self, key: str, comment_id: int) -> dict | None: ...
+
+    @abstractmethod
+    def comment_children(self, key: str) -> dict[int | None, list[dict]]:
+        """parent_id (None for top level) -> comments."""
+
+    @abstractmethod
+    def comment_version(self, key: str) -> Hashable:
+        """Changes whenever any comment on the food is added, removed or liked."""
+
+    @abstractmethod
+    def user_comments(self, user_id: int) -> list[tuple[str, dict]]:
+        """(kstr, comment) for every comment written by the user."""
+
+    @abstractmethod
+    def add_comment(self, key: str, item: dict):
+        """Stores `item`; may change item["id"] if it collides."""
+
+    @abstractmethod
+    def remove_comment(self, key: str, comment_id: int): ...
+
+    @abstractmethod
+    def bump_comment_likes(self, key: str, comment_id: int) -> int | None:
+        """New like count, or None if the comment does not exist."""
+
+
+class JsonStore(StoreBackend):
+    """The in-process dicts and JSON files of store.py."""
+    refresh            = staticmethod(store.sync)
+    like_state         = staticmethod(store.like_state)
+    toggle_like        = staticmethod(store.toggle_like)
+    my_rating          = staticmethod(store.my_rating)
+    set_rating         = staticmethod(store.set_rating)
+    food_agg           = staticmethod(store.food_agg)
+    counter_version    = staticmethod(store.counter_version)
+    write_step         = staticmethod(store.write_step)
+    find_comment       = staticmethod(store.find_comment)
+    comment_children   = staticmethod(store.comment_children)
+    comment_version    = staticmethod(store.comment_version)
+    user_comments      = staticmethod(store.user_comments)
+    add_comment        = staticmethod(store.add_comment)
+    remove_comment     = staticmethod(store.remove_comment)
+    bump_comment_likes = staticmethod(store.bump_comment_likes)
+
+
+def _make_backend() -> StoreBackend:
+    if STORE_BACKEND == "sql":
+        from sql_store import SqlStore
+        return SqlStore()
+    return JsonStore()
+
+
+data_store: StoreBackend = _make_backend()
+
+
+class CounterView(ABC):
+    """Base of per-process structures derived from the like/rating totals of
+    a SearchIndex's foods (the leaderboard, the catalog columns).
+
+    `version` is the counter_version() the structure reflects; current()
+    fails once the store moves past it, and the owner then rebuilds. touch()
+    re-reads one food after this process wrote it and advances `version`
+    along the write's exact step. Steps may arrive out of order, so
+    unmatched ones wait in `steps`; a change without a step (another worker,
+    a reload) leaves a gap the version never crosses, so it still rebuilds.
+    """
+    MAX_STEPS = 256
+
+    def __init__(self, index):
+        self.index   = index
+        self.version = data_store.counter_version()
+        self.steps: dict = {}  # version before a write -> after it
+        self.lock    = threading.Lock()
+
+    @abstractmethod
+    def _rescore(self, i: int, key: str):
+        """Re-read the food of doc `i`; called with `lock` held."""
+
+    def current(self, index) -> bool:
+        return self.index is index and self.version == data_store.counter_version()
+
+    def touch(self, key: str, step):
+        """After a like/rating write on `key`; `step` is data_store.write_step()."""
+        i = self.index.by_key.get(key)
+        with self.lock:
+            if i is not None:
+                self._rescore(i, key)
+            if step is None:
+                self.version = None
+                return
+            self.steps[step[0]] = step[1]
+            while self.version in self.steps:
+                self.version = self.steps.pop(self.version)
+            if len(self.steps) > self.MAX_STEPS:
+                self.version = None  # a gap that never closed
+                self.steps.clear()
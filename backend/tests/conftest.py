@@ -0,0 +1,103 @@
+"""Shared setup: the backend modules read their configuration on import, so the
+environment is fixed here, before any test module imports them. In-process
+tests share one JSON store in a temporary DATA_DIR; tests that need a fresh
+store (restarts, other modes) run it in a subprocess through run_store."""
+from __future__ import annotations
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import textwrap
+from pathlib import Path
+
+import pytest
+
+BACKEND = Path(__file__).resolve().parent.parent
+
+CATALOG = {
+    "Japan": {"foods": [
+        {"name": "壽司", "tags": ["米食", "海鮮"]},
+        {"name": "拉麵", "tags": ["麵食", "湯品"]},
+        {"name": "天婦羅", "tags": ["炸物", "海鮮"]},
+    ]},
+    "Taiwan": {"foods": [
+        {"name": "牛肉麵", "tags": ["麵食", "湯品"]},
+        {"name": "珍珠奶茶", "tags": ["飲品"]},
+        {"name": "鹽酥雞", "tags": ["炸物"]},
+    ]},
+}
+KEYS = [f"{code}|||{f['name']}" for code, country in (("JP", "Japan"), ("TW", "Taiwan"))
+        for f in CATALOG[country]["foods"]]
+
+
+def _env(data_dir: Path, **extra) -> dict:
+    env = {**os.environ, "DATA_DIR": str(data_dir), "FOODS_WATCH_INTERVAL": "0",
+           "STORE_BACKEND": "json", "STORE_MODE": "snapshot", "STORE_SHARED": "0",
+           "STORE_FLUSH_MS": "0", "JWT_SECRET": "test-secret-" + "x" * 32}
+    env.update({k: str(v) for k, v in extra.items()})
+    return env
+
+
+def write_catalog(data_dir: Path):
+    data_dir.mkdir(parents=True, exist_ok=True)
+    (data_dir / "foods.json").write_text(json.dumps(CATALOG, ensure_ascii=False), encoding="utf-8")
+
+
+_session_dir = Path(tempfile.mkdtemp(prefix="backend-tests-"))
+write_catalog(_session_dir)
+os.environ.update(_env(_session_dir))
+sys.path.insert(0, str(BACKEND))
+
+
+@pytest.fixture
+def run_store(tmp_path):
+    """run_store(code, **env) runs `code` in a new Python process on a store in
+    tmp_path (catalog included) and returns its stdout parsed as JSON; the
+    code prints one JSON value. Calls share tmp_path, so a second call is a
+    restart of the first."""
+    write_catalog(tmp_path)
+
+    def run(code: str, **env):
+        proc = subprocess.run(
+            [sys.executable, "-c", textwrap.dedent(code)], cwd=BACKEND, env=_env(tmp_path, **env),
+            capture_output=True, text=True, timeout=60,
+        )
+        assert proc.returncode == 0, proc.stderr
+        return json.loads(proc.stdout.strip().splitlines()[-1])
+
+    run.dir = tmp_path
+    return run
+
+
+@pytest.fixture
+def app(tmp_path):
+    """The app on a fresh SQLite database; the JSON store is the session's."""
+    from app import create_app
+    from models import db
+    app = create_app({"SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'test.db'}", "TESTING": True})
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def login(app, client):
+    """login(email) signs `client` in as a new user and returns its id."""
+    from helpers import make_token
+    from models import User, db
+
+    def sign_in(email: str = "a@example.com") -> int:
+        u = User(email=email, display_name=email.partition("@")[0], password_hash="x")
+        db.session.add(u)
+        db.session.commit()
+        client.set_cookie("auth_token", make_token(u.id))
+        return u.id
+
+    return sign_in
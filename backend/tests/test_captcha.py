@@ -0,0 +1,73 @@
+"""Both captcha modes: a solved challenge passes once, until it expires."""
+import pytest
+
+import captcha
+from captcha import ERR_EXPIRED, ERR_MISSING, ERR_WRONG, MemoryCaptcha, SignedCaptcha
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Every challenge is 3 + 4; now[0] is the time."""
+    now = [1000.0]
+    monkeypatch.setattr(captcha, "time", lambda: now[0])
+    monkeypatch.setattr(captcha, "_question", lambda: ("3 + 4 = ?", 7))
+    return now
+
+
+@pytest.fixture(params=[MemoryCaptcha, SignedCaptcha])
+def store(request):
+    return request.param()
+
+
+def test_solved_once(store, clock):
+    body, token = store.issue("1.2.3.4")
+    assert body["question"] == "3 + 4 = ?"
+    assert store.verify("1.2.3.4", 7, token or "") is None
+    assert store.verify("1.2.3.4", 7, token or "") == ERR_MISSING  # replay
+
+
+def test_wrong_answer_and_wrong_ip(store, clock):
+    _, token = store.issue("1.2.3.4")
+    assert store.verify("1.2.3.4", 8, token or "") == ERR_WRONG
+    assert store.verify("5.6.7.8", 7, token or "") in (ERR_MISSING, ERR_WRONG)
+    assert store.verify("1.2.3.4", 7, token or "") is None  # still solvable
+
+
+def test_expiry(store, clock):
+    _, token = store.issue("1.2.3.4")
+    clock[0] += captcha.CAPTCHA_TTL + 1
+    assert store.verify("1.2.3.4", 7, token or "") == ERR_EXPIRED
+
+
+def test_unissued(store, clock):
+    assert store.verify("1.2.3.4", 7, "") == ERR_MISSING
+
+
+def test_signed_token_is_bound_to_its_expiry(clock):
+    s = SignedCaptcha()
+    _, token = s.issue("1.2.3.4")
+    expires, nonce, mac = token.split(".")
+    assert s.verify("1.2.3.4", 7, f"{int(expires) + 600}.{nonce}.{mac}") == ERR_WRONG
+    assert SignedCaptcha(secret="other").verify("1.2.3.4", 7, token) == ERR_WRONG
+
+
+def test_memory_keeps_at_most_max_entries(clock):
+    m = MemoryCaptcha(max_entries=2)
+    for ip in ("a", "b", "c"):
+        m.issue(ip)
+    assert list(m.entries) == ["b", "c"]
+    clock[0] += captcha.CAPTCHA_TTL + 1
+    m.issue("d")  # expired entries go first
+    assert list(m.entries) == ["d"]
+
+
+def test_signed_forgets_spent_nonces_once_expired(clock):
+    s = SignedCaptcha()
+    for _ in range(3):
+        _, token = s.issue("1.2.3.4")
+        assert s.verify("1.2.3.4", 7, token) is None
+    assert len(s.spent) == 3
+    clock[0] += captcha.CAPTCHA_TTL + 1
+    _, token = s.issue("1.2.3.4")
+    assert s.verify("1.2.3.4", 7, token) is None
+    assert len(s.spent) == 1
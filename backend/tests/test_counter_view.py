@@ -0,0 +1,96 @@
+"""Leaderboard and catalog columns follow like/rating writes through touch()
+and rebuild when a write reaches the store without one."""
+import threading
+
+import pytest
+
+import leaderboard
+from foods_routes import _counted
+from search_index import get_index
+from store_backend import data_store
+
+from conftest import KEYS
+
+
+def _like(key, who):
+    data_store.toggle_like(key, who)
+    return data_store.write_step()
+
+
+def _rate(key, who, stars):
+    data_store.set_rating(key, who, stars)
+    return data_store.write_step()
+
+
+def _fresh_top(k=len(KEYS)):
+    return leaderboard.Leaderboard(get_index()).top(k)
+
+
+@pytest.mark.parametrize("order", ["in order", "reversed"])
+def test_interleaved_writers_keep_board(order):
+    b = leaderboard.board()
+    # A writes, B writes, then both touch: A's touch must not skip B's food.
+    sa = _like(KEYS[0], f"ip:a-{order}")
+    sb = _rate(KEYS[1], f"ip:b-{order}", 5)
+    touches = [(KEYS[0], sa), (KEYS[1], sb)]
+    if order == "reversed":
+        touches.reverse()
+    for key, step in touches:
+        leaderboard.touch(key, step, 1)
+    assert leaderboard.board() is b
+    assert b.top(len(KEYS)) == _fresh_top()
+
+
+def test_write_without_touch_rebuilds():
+    b = leaderboard.board()
+    _like(KEYS[2], "ip:untouched")   # another worker, say
+    leaderboard.touch(KEYS[3], _like(KEYS[3], "ip:touched"), 1)
+    rebuilt = leaderboard.board()
+    assert rebuilt is not b
+    assert rebuilt.top(len(KEYS)) == _fresh_top()
+
+
+def test_unknown_step_rebuilds():
+    b = leaderboard.board()
+    data_store.toggle_like(KEYS[4], "ip:nostep")
+    leaderboard.touch(KEYS[4], None, 1)
+    assert leaderboard.board() is not b
+
+
+def test_concurrent_writers():
+    b = leaderboard.board()
+
+    def writer(n):
+        for i in range(40):
+            key = KEYS[(n + i) % len(KEYS)]
+            if i % 3:
+                data_store.toggle_like(key, f"ip:t{n}-{i % 5}")
+                _counted(key, 1)
+            else:
+                old = data_store.set_rating(key, f"ip:t{n}", 1 + i % 5)
+                _counted(key, 1.5 * (1 + i % 5 - old))
+
+    threads = [threading.Thread(target=writer, args=(n,)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert leaderboard.board() is b  # every write was touched: no rebuild
+    assert b.top(len(KEYS)) == _fresh_top()
+
+
+def test_columns_follow_touches():
+    np = pytest.importorskip("numpy")
+    import catalog_columns
+    c = catalog_columns.Columns(get_index())
+    sa = _rate(KEYS[5], "ip:col-a", 4)
+    sb = _like(KEYS[0], "ip:col-b")
+    c.touch(KEYS[0], sb)
+    assert not c.current(get_index())  # A's write is not in yet
+    c.touch(KEYS[5], sa)
+    assert c.current(get_index())
+    fresh = catalog_columns.Columns(get_index())
+    for col in ("likes", "rating_sum", "rating_count", "avg10"):
+        assert np.array_equal(getattr(c, col), getattr(fresh, col)), col
+    _like(KEYS[1], "ip:col-untouched")
+    assert not c.current(get_index())
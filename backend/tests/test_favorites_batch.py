@@ -0,0 +1,76 @@
+"""The bulk favorites endpoints: one result code per item, in input order."""
+import pytest
+
+import favorites_routes
+
+SUSHI, RAMEN, TEA = ({"country_code": c, "food_name": n}
+                     for c, n in (("JP", "壽司"), ("jp ", " 拉麵 "), ("TW", "珍珠奶茶")))
+
+
+def _ids(client):
+    favs = client.get("/api/favorites").get_json()["favorites"]
+    return {f["food_name"]: f["id"] for f in favs}
+
+
+def test_add(client, login):
+    login()
+    r = client.post("/api/favorites/batch", json={"items": [SUSHI, RAMEN]})
+    assert r.get_json() == {"added": 2, "results": ["added", "added"]}
+    r = client.post("/api/favorites/batch", json={"items": [
+        SUSHI, TEA, {"country_code": "TW"}, "壽司", TEA, {"country_code": "JP", "food_name": "拉麵"},
+    ]})
+    assert r.get_json() == {"added": 1, "results": ["exists", "added", "invalid", "invalid", "duplicate", "exists"]}
+    assert set(_ids(client)) == {"壽司", "拉麵", "珍珠奶茶"}
+
+
+def test_add_without_items_is_empty(client, login):
+    login()
+    assert client.post("/api/favorites/batch", json={}).get_json() == {"added": 0, "results": []}
+
+
+def test_remove(client, login):
+    login()
+    client.post("/api/favorites/batch", json={"items": [SUSHI, RAMEN]})
+    r = client.delete("/api/favorites/batch", json={"items": [RAMEN, TEA, RAMEN, {}]})
+    assert r.get_json() == {"deleted": 1, "results": ["deleted", "not_found", "duplicate", "invalid"]}
+    assert set(_ids(client)) == {"壽司"}
+
+
+def test_move(client, login):
+    login()
+    client.post("/api/favorites/batch", json={"items": [SUSHI, RAMEN]})
+    ids = _ids(client)
+    list_id = client.post("/api/favorite-lists", json={"name": "日本"}).get_json()["id"]
+    r = client.put("/api/favorites/move/batch", json={
+        "list_id": list_id, "favorite_ids": [ids["壽司"], 999, ids["壽司"], "1", True]})
+    assert r.get_json() == {"moved": 1, "results": ["moved", "not_found", "duplicate", "invalid", "invalid"]}
+    lists = client.get("/api/favorites?with_lists=1").get_json()
+    assert [f["food_name"] for f in lists["lists"][0]["favorites"]] == ["壽司"]
+    assert [f["food_name"] for f in lists["unlisted"]] == ["拉麵"]
+    r = client.put("/api/favorites/move/batch", json={"list_id": 999, "favorite_ids": [ids["拉麵"]]})
+    assert r.status_code == 404
+
+
+def test_other_users_favorites_are_not_found(client, login):
+    login("a@example.com")
+    client.post("/api/favorites/batch", json={"items": [SUSHI]})
+    fid = _ids(client)["壽司"]
+    login("b@example.com")
+    assert client.delete("/api/favorites/batch", json={"items": [SUSHI]}).get_json()["results"] == ["not_found"]
+    r = client.put("/api/favorites/move/batch", json={"list_id": None, "favorite_ids": [fid]})
+    assert r.get_json()["results"] == ["not_found"]
+    assert client.post("/api/favorites/batch", json={"items": [SUSHI]}).get_json()["results"] == ["added"]
+
+
+@pytest.mark.parametrize("method,url,field", [
+    ("post", "/api/favorites/batch", "items"),
+    ("delete", "/api/favorites/batch", "items"),
+    ("put", "/api/favorites/move/batch", "favorite_ids"),
+])
+def test_bad_batches(client, login, monkeypatch, method, url, field):
+    send = getattr(client, method)
+    assert send(url, json={field: []}).status_code == 401
+    login()
+    assert send(url, json={field: "x"}).status_code == 400
+    monkeypatch.setattr(favorites_routes, "FAVORITES_BATCH_MAX", 2)
+    assert send(url, json={field: [1, 2, 3]}).status_code == 413
@@ -0,0 +1,95 @@
+"""Image variant URLs and the files behind them, on a catalog of its own."""
+import os
+
+import pytest
+
+import images
+from search_index import SearchIndex
+
+Image = pytest.importorskip("PIL.Image")
+
+
+@pytest.fixture
+def static(tmp_path, monkeypatch):
+    root = tmp_path / "static"
+    (root / "foods").mkdir(parents=True)
+    Image.new("RGB", (800, 400), "red").save(root / "foods" / "sushi.jpg")
+    Image.new("RGBA", (100, 50), "blue").save(root / "foods" / "ramen.png")
+    (tmp_path / "secret.jpg").write_bytes(b"x")
+    index = SearchIndex({"Japan": {"foods": [
+        {"name": "壽司", "img": "/static/foods/sushi.jpg"},
+        {"name": "拉麵", "img": "/static/foods/ramen.png"},
+        {"name": "天婦羅", "img": "/static/foods/missing.jpg"},
+        {"name": "章魚燒", "img": "https://example.com/takoyaki.jpg"},
+        {"name": "飯糰", "img": "/static/../secret.jpg"},
+        {"name": "味噌湯"},
+    ]}})
+    monkeypatch.setattr(images, "STATIC_DIR", root)
+    monkeypatch.setattr(images, "IMAGE_CACHE_DIR", tmp_path / "cache")
+    monkeypatch.setattr(images, "get_index", lambda: index)
+    monkeypatch.setattr(images, "_known", {})
+    monkeypatch.setattr(images, "_catalog", None)
+    monkeypatch.setattr(images, "_prerender", lambda c: None)  # render on request only
+    return root
+
+
+def _name(url):
+    assert url.startswith(images.URL_PREFIX)
+    return url[len(images.URL_PREFIX):]
+
+
+def test_variants(static):
+    v = images.variants("/static/foods/sushi.jpg")
+    assert set(v) == {"thumb", "medium", "full"}
+    assert v["full"].endswith("-full.jpg")
+    assert v["thumb"].endswith(f"-thumb.{images._EXT}")
+    assert images.variants("/static/foods/ramen.png")["full"].endswith("-full.png")
+    for img in ("/static/foods/missing.jpg", "https://example.com/takoyaki.jpg",
+                "/static/../secret.jpg", None):
+        assert images.variants(img) is None
+
+
+def test_same_bytes_same_urls(static):
+    os.link(static / "foods" / "sushi.jpg", static / "foods" / "copy.jpg")
+    assert images.variants("/static/foods/copy.jpg") == images.variants("/static/foods/sushi.jpg")
+
+
+def test_file_for(static):
+    v = images.variants("/static/foods/sushi.jpg")
+    assert images.file_for(_name(v["full"])) == static / "foods" / "sushi.jpg"
+    thumb = images.file_for(_name(v["thumb"]))
+    with Image.open(thumb) as im:
+        assert im.size == (320, 160)
+    assert images.file_for(_name(v["thumb"])) == thumb  # rendered once, then served
+
+
+def test_file_for_unknown_names(static):
+    digest = _name(images.variants("/static/foods/sushi.jpg")["full"])[:16]
+    for name in ("nope", "0123456789abcdef-thumb.webp", f"{digest}-full.png",
+                 f"{digest}-huge.{images._EXT}", f"{digest}-thumb.gif", f"../{digest}-full.jpg"):
+        assert images.file_for(name) is None, name
+
+
+def test_replaced_file_invalidates_old_urls(static):
+    v = images.variants("/static/foods/sushi.jpg")
+    Image.new("RGB", (10, 10), "green").save(static / "foods" / "sushi.jpg")
+    assert images.file_for(_name(v["full"])) is None
+    assert images.file_for(_name(v["thumb"])) is None
+
+
+def test_without_pillow_every_variant_is_the_original(static, monkeypatch):
+    monkeypatch.setattr(images, "Image", None)
+    v = images.variants("/static/foods/sushi.jpg")
+    assert v["thumb"] == v["medium"] == v["full"]
+    assert images.file_for(_name(v["full"])) == static / "foods" / "sushi.jpg"
+    assert images.file_for(_name(v["full"]).replace("-full.jpg", f"-thumb.{images._EXT}")) is None
+
+
+def test_route(static, client):
+    v = images.variants("/static/foods/sushi.jpg")
+    r = client.get(v["thumb"])
+    assert r.status_code == 200
+    assert r.headers["Cache-Control"] == "public, max-age=31536000, immutable"
+    r.close()
+    r = client.get(images.URL_PREFIX + "0123456789abcdef-thumb.jpg")
+    assert r.status_code == 404 and r.get_json()["error"] == "圖片不存在"
@@ -0,0 +1,89 @@
+"""Cursor pagination: Page and the list endpoints that use it."""
+import pytest
+
+from conftest import CATALOG
+from helpers import Page, decode_cursor, encode_cursor
+
+
+@pytest.mark.parametrize("key", [(1, "壽司"), (-3, 4.5, "JP", "a|||b"), ("",), ()])
+def test_cursor_round_trips(key):
+    assert decode_cursor(encode_cursor(key)) == key
+
+
+@pytest.mark.parametrize("cursor", ["!!!", "e30", encode_cursor(("x",))[:-2] + "$$", "bnVsbA"])
+def test_bad_cursor(cursor):
+    # e30 is {} and bnVsbA is null: JSON, but not a sort key.
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+def _by_bucket(x):
+    return -(x["n"] % 3), x["name"]
+
+
+def _by_name(x):
+    return (x["name"],)
+
+
+def _walk(items, key, limit):
+    pages, after = [], None
+    while True:
+        page, meta = Page(limit, after, False).apply(items, key)
+        pages.append(page)
+        if meta["next_cursor"] is None:
+            return pages
+        after = decode_cursor(meta["next_cursor"])
+
+
+def test_pages_cover_the_list_once():
+    items = [{"n": n, "name": f"f{n}"} for n in range(11)]
+    pages = _walk(items, _by_bucket, 4)
+    assert [len(p) for p in pages] == [4, 4, 3]
+    assert [x for p in pages for x in p] == sorted(items, key=_by_bucket)
+
+
+def test_pages_stay_stable_when_items_are_added():
+    items = [{"name": f"f{n:02}"} for n in range(0, 20, 2)]
+    first, meta = Page(3, None, True).apply(items, _by_name)
+    assert meta["total"] == 10
+    items.append({"name": "f01"})  # sorts before the cursor: not served again
+    items.append({"name": "f07"})
+    second, _ = Page(3, decode_cursor(meta["next_cursor"]), False).apply(items, _by_name)
+    assert [x["name"] for x in first + second] == ["f00", "f02", "f04", "f06", "f07", "f08"]
+
+
+def test_cursor_from_another_sort_order_is_an_empty_page():
+    page, meta = Page(2, ("a", "b"), False).apply([{"n": 1}], lambda x: (x["n"],))
+    assert page == [] and meta["next_cursor"] is None
+
+
+def test_from_request(app):
+    with app.test_request_context("/"):
+        p = Page.from_request()
+        assert (p.limit, p.after, p.want_total) == (None, None, False)
+    with app.test_request_context("/?limit=1000&total=1"):
+        p = Page.from_request()
+        assert (p.limit, p.want_total) == (100, True)
+    with app.test_request_context(f"/?cursor={encode_cursor(('x',))}&limit=abc"):
+        p = Page.from_request()
+        assert (p.limit, p.after) == (20, ("x",))
+
+
+def test_foods_endpoint_pages(client):
+    names, cursor = [], ""
+    while True:
+        body = client.get(f"/api/foods/JP?sort=name&limit=2&total=1&cursor={cursor}").get_json()
+        assert body["total"] == 3
+        names += [f["name"] for f in body["foods"]]
+        cursor = body["next_cursor"]
+        if cursor is None:
+            break
+    assert names == sorted(f["name"] for f in CATALOG["Japan"]["foods"])
+    # Without limit or cursor the whole list comes back, as before.
+    assert len(client.get("/api/foods/JP").get_json()["foods"]) == 3
+
+
+def test_bad_cursor_is_400(client):
+    for url in ("/api/foods/JP?cursor=!!!", "/api/search?cursor=e30"):
+        r = client.get(url)
+        assert r.status_code == 400 and r.get_json()["error"] == "cursor 無效"
@@ -0,0 +1,73 @@
+"""Token buckets: retry_after from _take() and both limiter backends."""
+import pytest
+
+import rate_limit
+from rate_limit import _take
+
+
+def test_first_hit_is_allowed():
+    ok, retry, state = _take(None, 100.0, "comment_anon")
+    assert (ok, retry) == (True, 0)
+    assert state == (0.0, 100.0, 130.0)  # empty, full again after one interval
+
+
+@pytest.mark.parametrize("elapsed,retry", [(0, 31), (0.5, 30), (10, 21), (29.5, 1)])
+def test_retry_after_counts_down(elapsed, retry):
+    _, _, state = _take(None, 100.0, "comment_anon")  # 30 s per token
+    ok, got, _ = _take(state, 100.0 + elapsed, "comment_anon")
+    assert (ok, got) == (False, retry)
+
+
+def test_refilled_bucket_allows_again():
+    _, _, state = _take(None, 100.0, "like")
+    assert _take(state, 102.0, "like")[:2] == (True, 0)
+
+
+def test_rejected_hits_do_not_push_retry_back():
+    _, _, state = _take(None, 100.0, "like")
+    _, _, state = _take(state, 101.0, "like")
+    assert _take(state, 101.5, "like")[:2] == (False, 1)
+
+
+def test_burst(monkeypatch):
+    monkeypatch.setitem(rate_limit.LIMITS, "burst", (10, 3))
+    state, now = None, 0.0
+    for _ in range(3):
+        ok, _, state = _take(state, now, "burst")
+        assert ok
+    assert _take(state, now, "burst")[:2] == (False, 11)
+    # One interval later exactly one more hit fits.
+    ok, _, state = _take(state, now + 10, "burst")
+    assert ok and not _take(state, now + 10, "burst")[0]
+
+
+def test_unknown_action_uses_the_default():
+    _, _, state = _take(None, 0.0, "no-such-action")
+    assert _take(state, 0.0, "no-such-action")[:2] == (False, 3)
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def limiter(request, tmp_path):
+    if request.param == "sqlite":
+        return rate_limit.SqliteLimiter(tmp_path / "ratelimit.db")
+    return rate_limit.MemoryLimiter(shards=2, max_keys=4)
+
+
+def test_limiter(limiter):
+    assert limiter.hit("like:1.2.3.4:JP|||壽司", "like") == (True, 0)
+    ok, retry = limiter.hit("like:1.2.3.4:JP|||壽司", "like")
+    assert not ok and 1 <= retry <= 3
+    assert limiter.hit("like:1.2.3.4:JP|||拉麵", "like") == (True, 0)  # another key
+    assert limiter.metrics()["actions"] == {"like": {"allowed": 2, "rejected": 1}}
+
+
+def test_memory_limiter_forgets_refilled_buckets(monkeypatch):
+    limiter = rate_limit.MemoryLimiter(shards=1, max_keys=100)
+    now = [1000.0]
+    monkeypatch.setattr(rate_limit, "time", lambda: now[0])
+    for i in range(5):
+        limiter.hit(f"k{i}", "like")
+    now[0] += 60
+    limiter.hit("k9", "like")
+    assert limiter.metrics()["keys"] == 1
+    assert limiter.hit("k0", "like") == (True, 0)
@@ -0,0 +1,77 @@
+"""SearchIndex against the linear substring scan it replaced."""
+import pytest
+
+from search_index import SearchIndex
+
+DATA = {
+    "Japan": {"foods": [
+        {"name": "壽司", "desc": "Fresh Sushi rice", "tags": ["米食", "海鮮"]},
+        {"name": "拉麵", "desc": "豚骨湯頭", "tags": ["麵食", "湯品"]},
+        {"name": "天婦羅", "tags": ["炸物", "海鮮"]},
+        {"name": "Takoyaki", "desc": "章魚燒 ball", "tags": ["Street Food"]},
+    ]},
+    "Taiwan": {"foods": [
+        {"name": "牛肉麵", "desc": "紅燒湯頭", "tags": ["麵食", "湯品"]},
+        {"name": "珍珠奶茶", "tags": ["飲品"]},
+        {"name": "鹽酥雞", "desc": "aaa", "tags": ["炸物", "Street Food"]},
+    ]},
+    "Korea": {"foods": [
+        {"name": "拌飯", "tags": []},
+        {"name": "Kimchi Jjigae", "desc": "辛奇湯", "tags": ["湯品"]},
+    ]},
+}
+
+
+def _linear(data, q="", country="", tag=""):
+    """The scan search() used to run, over (code, name) in catalog order."""
+    out = []
+    for code, country_name in (("JP", "Japan"), ("TW", "Taiwan"), ("KR", "Korea")):
+        if country and code != country:
+            continue
+        for f in data[country_name]["foods"]:
+            if tag and tag not in f.get("tags", []):
+                continue
+            texts = [f["name"].lower(), f.get("desc", "").lower()] + [t.lower() for t in f["tags"]]
+            if q and not any(q in t for t in texts):
+                continue
+            out.append((code, f["name"]))
+    return out
+
+
+def _queries(data):
+    """Every substring of every indexed text, plus some that match nothing."""
+    qs = {"", "x", "zz", "湯頭濃", "sushi rice fresh", "aaaa"}
+    for block in data.values():
+        for f in block["foods"]:
+            for text in [f["name"], f.get("desc", ""), *f["tags"]]:
+                text = text.lower()
+                qs.update(text[i:j] for i in range(len(text)) for j in range(i + 1, len(text) + 1))
+    return sorted(qs)
+
+
+@pytest.fixture(scope="module")
+def index():
+    return SearchIndex(DATA)
+
+
+def test_every_substring_matches_like_the_linear_scan(index):
+    for q in _queries(DATA):
+        got = [(d.code, d.food["name"]) for d, _ in index.search(q)]
+        assert got == _linear(DATA, q), q
+
+
+@pytest.mark.parametrize("country,tag", [("JP", ""), ("", "湯品"), ("TW", "炸物"), ("KR", "飲品"), ("US", "")])
+def test_filters_combine_with_the_query(index, country, tag):
+    for q in ("", "湯", "a", "麵", "street"):
+        got = [(d.code, d.food["name"]) for d, _ in index.search(q, country, tag)]
+        assert got == _linear(DATA, q, country, tag), (q, country, tag)
+
+
+def test_scores(index):
+    def score(q, name):
+        return dict((d.food["name"], sc) for d, sc in index.search(q))[name]
+    assert score("拉麵", "拉麵") == 4.0       # whole name
+    assert score("牛肉", "牛肉麵") == 3.0     # name prefix
+    assert score("湯頭", "拉麵") == 0.5       # description only
+    assert score("湯品", "拉麵") == 1.5       # whole tag
+    assert score("street", "Takoyaki") == 1.0  # part of a tag
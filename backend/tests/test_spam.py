@@ -0,0 +1,69 @@
+"""The spam rules, each on its own pipeline, and the flood index."""
+import pytest
+
+import spam
+
+
+def _fires(rule, text):
+    return spam.Pipeline([rule]).is_spam(text)
+
+
+@pytest.mark.parametrize("text", [
+    "推薦這家 http://www.example.com",
+    "推薦這家 https://www.example.com",
+    "推薦這家 www.example.com",
+])
+def test_one_link_passes(text):
+    assert not _fires(spam.LinkRule(), text)
+    assert not spam.Pipeline([spam.LinkRule(), spam.RepeatRule(), spam.ShoutRule()]).is_spam(text)
+
+
+@pytest.mark.parametrize("text", [
+    "http://a.example.com https://b.example.com",
+    "http://www.a.example.com www.b.example.com",
+    "看 www.a.com 和 www.b.com",
+])
+def test_several_links_are_rejected(text):
+    assert _fires(spam.LinkRule(), text)
+
+
+def test_links_in_long_text_pass():
+    text = "湯頭濃郁" * 60 + " http://a.example.com https://b.example.com"
+    assert not _fires(spam.LinkRule(), text)
+
+
+def test_repeat():
+    assert _fires(spam.RepeatRule(), "好好好好好好好吃")
+    assert not _fires(spam.RepeatRule(), "好好好好好好吃")
+    assert not _fires(spam.RepeatRule(), "\n" * 10)  # "." skips newlines
+
+
+def test_shout():
+    assert _fires(spam.ShoutRule(), "BEST RAMEN EVER")
+    assert not _fires(spam.ShoutRule(), "Best ramen ever")
+    assert not _fires(spam.ShoutRule(), "OK 好吃")  # too few letters to tell
+
+
+def test_blocklist_matches_case_insensitively():
+    rule = spam.BlocklistRule(["代購", "casino", ""])
+    assert _fires(rule, "專業代購 line 聯絡")
+    assert _fires(rule, "Best CASINO in town")
+    assert not _fires(rule, "好吃的拉麵")
+
+
+def test_flood_rejects_repeated_comments():
+    index = spam.FloodIndex(window=600)
+    p = spam.Pipeline([spam.FloodRule(index, count=3)])
+    text = "這家拉麵湯頭濃郁叉燒入口即化強力推薦大家來吃"
+    for _ in range(3):
+        assert not p.is_spam(text)
+        index.add(p.scan(text).norm)
+    assert p.is_spam(text.upper() + "!!")  # the same once normalized
+    assert not p.is_spam("壽司新鮮價格便宜服務親切下次還會再來光顧")
+
+
+def test_flood_ignores_short_comments():
+    index = spam.FloodIndex()
+    for _ in range(10):
+        index.add("好吃")
+    assert index.similar("好吃") == 0
@@ -0,0 +1,48 @@
+"""SqlStore.set_rating against SQLite: totals, the previous stars it returns,
+the write step it records and the bounded retry."""
+import pytest
+
+import sql_store
+from app import create_app
+from models import db
+
+
+@pytest.fixture
+def store(tmp_path):
+    app = create_app({"SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'test.db'}", "TESTING": True})
+    with app.app_context():
+        db.create_all()
+        yield sql_store.SqlStore()
+        db.session.remove()
+
+
+def test_set_rating_totals(store):
+    assert store.set_rating("JP|||拉麵", "ip:1", 4) == 0
+    assert store.set_rating("JP|||拉麵", "ip:1", 2) == 4   # re-rating
+    assert store.set_rating("JP|||拉麵", "ip:2", 5) == 0
+    a = store.food_agg("JP|||拉麵")
+    assert (a.rating_sum, a.rating_count) == (7, 2)
+    assert store.my_rating("JP|||拉麵", "ip:1") == 2
+    # Another worker reads the same totals from food_stats.
+    other = sql_store.SqlStore()
+    a = other.food_agg("JP|||拉麵")
+    assert (a.rating_sum, a.rating_count) == (7, 2)
+
+
+def test_set_rating_records_its_step(store):
+    before = store.counter_version()
+    store.set_rating("JP|||壽司", "ip:1", 3)
+    assert store.write_step() == (before, store.counter_version())
+    assert store.counter_version() == before + 1
+    assert store.counter_version("JP|||壽司") == 1
+
+
+def test_set_rating_gives_up_after_retries(store, monkeypatch):
+    store.set_rating("JP|||壽司", "ip:1", 3)
+    # Every insert loses to a concurrent one that is gone again by the next read.
+    monkeypatch.setattr(sql_store, "insert_ignore", lambda *a, **k: 0)
+    with pytest.raises(RuntimeError):
+        store.set_rating("JP|||壽司", "ip:9", 5)
+    a = store.food_agg("JP|||壽司")
+    assert (a.rating_sum, a.rating_count) == (3, 1)
+    assert store.my_rating("JP|||壽司", "ip:9") == 0
@@ -0,0 +1,69 @@
+"""Locking of the multi-process store mode (STORE_SHARED) and of add_food."""
+
+ADD_FOOD_WITHOUT_FCNTL = """
+    import json, os, threading
+    import store
+    store.fcntl = None          # as on Windows
+    from app import create_app
+    from models import User, db
+    from helpers import make_token
+    app = create_app({"SQLALCHEMY_DATABASE_URI": "sqlite:///" + os.path.join(os.environ["DATA_DIR"], "t.db")})
+    with app.app_context():
+        db.create_all()
+        u = User(email="a@example.com", display_name="a", password_hash="x")
+        db.session.add(u)
+        db.session.commit()
+        token = make_token(u.id)
+    client = app.test_client()
+    client.set_cookie("auth_token", token)
+    out = {}
+
+    def run():
+        out["add"] = client.post("/api/foods/JP", json={"name": "飯糰"}).status_code
+        out["like"] = client.post("/api/food/JP/飯糰/like").get_json()["likes"]
+
+    t = threading.Thread(target=run, daemon=True)
+    t.start()
+    t.join(10)
+    print(json.dumps(out))
+"""
+
+
+def test_add_food_without_fcntl_does_not_deadlock(run_store):
+    # add_food saves foods.json inside file_lock(); a like then saves likes.json.
+    assert run_store(ADD_FOOD_WITHOUT_FCNTL) == {"add": 201, "like": 1}
+
+
+RELOAD_WHILE_RATING = """
+    import json, threading, store
+    store.load()
+    store.toggle_like("JP|||壽司", "ip:1")
+    errors, done = [], threading.Event()
+
+    def reload_likes():   # as _catch_up() does after another worker's write
+        try:
+            while not done.is_set():
+                with store._store_locks[store.LIKES_JSON]:
+                    store._reload_store(store.LIKES_JSON)
+        except Exception as e:
+            errors.append(repr(e))
+
+    t = threading.Thread(target=reload_likes)
+    t.start()
+    for i in range(2000):
+        store.set_rating(f"JP|||food{i}", "ip:1", 1 + i % 5)
+    done.set()
+    t.join()
+    aggs = [store.food_agg(f"JP|||food{i}") for i in range(2000)]
+    print(json.dumps({
+        "errors": errors,
+        "ratings": sum(a.rating_sum for a in aggs) == sum(1 + i % 5 for i in range(2000))
+                   and all(a.rating_count == 1 for a in aggs),
+        "likes": store.food_agg("JP|||壽司").likes,
+    }))
+"""
+
+
+def test_reload_keeps_the_other_stores_totals(run_store):
+    # Reloading likes.json must neither iterate ratings nor drop their totals.
+    assert run_store(RELOAD_WHILE_RATING) == {"errors": [], "ratings": True, "likes": 1}